@@ -1,67 +1,125 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, Toplevel
-import csv
+from tkinter import ttk, messagebox, filedialog, simpledialog, Toplevel
 import os
-from datetime import datetime
+import threading
+from lcd_storage import SERIAL_NUMBER_MAX_LENGTH, WORK_ORDER_MAX_LENGTH, DuplicateEntryError, make_key
+from lcd_archive import ARCHIVE_AFTER_DAYS, archive_closed, archive_dir_for
+from lcd_core import LOG_FILE, add_entry, delete_entry, open_log, update_status
+from lcd_export import export_log, make_filter
+from lcd_import import import_csv
+from lcd_model import STATUSES, RecordStore, StatusCounters, count_statuses
+from lcd_search import SearchIndex
+from lcd_sync import apply_change
+from lcd_trace import configure_logging, logger, recorder, traced, tracing
+from lcd_view import VirtualTreeview
+from lcd_worker import IOExecutor
 
 # Define the file name for the log
-log_file = 'lcd_log.csv'
-
-# Function to initialize the log file if it doesn't exist
+log_file = LOG_FILE
+
+# Closed entries moved out of the live log are kept here
+archive_dir = archive_dir_for(log_file)
+
+# Storage backend: 'csv' keeps the flat file, 'sqlite' uses an indexed database
+# (migrated from the CSV log the first time it is selected), 'journal' appends
+# each change to a journal that is compacted into the CSV log in the background
+storage_backend = os.environ.get('LCD_STORAGE', 'csv')
+storage = None
+
+# Set LCD_SERVER to host:port to share one log between workstations through
+# a log server (python lcd_sync.py --listen 0.0.0.0:50507). Every change is
+# then pushed by the server, and the local store follows that feed.
+log_server = os.environ.get('LCD_SERVER')
+
+# In-memory copy of the log; the Treeview and dashboard follow its changes
+store = RecordStore()
+status_counters = StatusCounters()
+store.subscribe(status_counters)
+search_index = SearchIndex()
+store.subscribe(search_index)
+last_search_query = None
+search_after_id = None
+
+# Change events from the log server that arrived while a full reload from it
+# was being prepared; None when no reload is under way
+remote_backlog = None
+
+# Keys whose add is queued on the I/O executor but not yet stored
+pending_adds = set()
+
+# Dashboard rows counting entries that have sat in a status for too long
+dashboard_age_buckets = [("Ordered", 7), ("Pending", 7), ("Pending", 30)]
+
+# Function to initialize the log storage if it doesn't exist
 def initialize_log():
-    if not os.path.exists(log_file):
-        with open(log_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Work Order', 'Serial Number', 'Status', 'Notes', 'Timestamp'])
-
-# Function to add a new entry to the log
-def add_entry(work_order, serial_number, status, notes):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_file, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([work_order, serial_number, status, notes, timestamp])
-
-# Function to update the status of an entry in the log
-def update_status(work_order, serial_number, new_status):
-    rows = []
-    updated = False
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    with open(log_file, mode='r') as file:
-        reader = csv.reader(file)
-        header = next(reader)  # Read the header row
-        rows.append(header)  # Keep the header in the rows
-        for row in reader:
-            print(f"Checking row: {row}")  # Debugging output
-            if len(row) == 5:
-                print(f"Row details - Work Order: {row[0]}, Serial Number: {row[1]}, Status: {row[2]}")  # More detailed output
-                if row[0] == work_order and row[1] == serial_number:
-                    print(f"Match found. Updating status from {row[2]} to {new_status}")
-                    row[2] = new_status
-                    row[4] = timestamp
-                    updated = True
-                    print(f"Updated row: {row}")
-            rows.append(row)
-
-    if updated:
-        with open(log_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerows(rows)
-        print("Log file updated")
-        display_log()  # Refresh log in UI
-        update_dashboard()  # Refresh dashboard
+    global storage
+    storage = open_log(log_file, storage_backend, log_server)
+
+# Function to reload every log entry from storage into the treeview. The
+# entries, search index, counters and sort orders are all built on the I/O
+# executor; the Tk thread only swaps them in. The reload runs as a barrier,
+# so a write queued before it is in the log it reads, and one queued after
+# it is applied to the store it swaps in.
+def display_log():
+    if log_server:
+        # The snapshot arrives through the change feed, in order with the rest
+        io_executor.submit(storage.request_snapshot)
     else:
-        print("No matching entry found to update")
+        io_executor.submit(lambda: store.prepare_load(storage.rows()), on_done=loaded_log, barrier=True, name='load_log')
+
+@traced('ui.load_log')
+def loaded_log(prepared):
+    store.finish_load(prepared)
+    # prepared now holds the log that was replaced; freeing a large one
+    # takes a while too, so that is left to the I/O executor as well
+    io_executor.submit(prepared.clear, name='free_log')
+    update_dashboard()
 
-# Function to display the log entries in the treeview
-def display_log():
-    for i in tree.get_children():
-        tree.delete(i)
-    with open(log_file, mode='r') as file:
-        reader = csv.reader(file)
-        next(reader)  # Skip header row
-        for row in reader:
-            tree.insert('', 'end', values=row)
+# Function to apply a change pushed by the log server (from any workstation).
+# A full reload is prepared on the I/O executor like display_log(); changes
+# that arrive meanwhile wait and are applied after it, in order.
+@traced('ui.remote_change')
+def apply_remote_change(event):
+    global remote_backlog
+    if remote_backlog is not None:
+        remote_backlog.append(event)
+    elif event['event'] == 'reset':
+        remote_backlog = []
+        io_executor.submit(store.prepare_load, event['rows'], on_done=loaded_remote_log,
+                           on_error=failed_remote_log, name='load_log')
+    else:
+        apply_change(store, event)
+        update_dashboard()
+
+def loaded_remote_log(prepared):
+    loaded_log(prepared)
+    apply_remote_backlog()
+
+def failed_remote_log(error):
+    show_io_error(error)
+    apply_remote_backlog()
+
+def apply_remote_backlog():
+    global remote_backlog
+    backlog, remote_backlog = remote_backlog, None
+    for event in backlog:
+        apply_remote_change(event)
+
+# Function to report a failed background operation
+def show_io_error(error):
+    logger.error("An error occurred while processing the log file: %s", error)
+    messagebox.showerror("File Error", f"An error occurred: {error}")
+
+# Function to show or hide the busy indicator while storage work is queued
+def show_busy(pending):
+    if pending:
+        lbl_busy.config(text=f"Saving ({pending} pending)...")
+        progress_busy.grid()
+        progress_busy.start(10)
+    else:
+        lbl_busy.config(text="")
+        progress_busy.stop()
+        progress_busy.grid_remove()
 
 # Function to handle adding a new entry
 def handle_add_entry():
@@ -71,17 +129,36 @@ def handle_add_entry():
     notes = text_notes.get("1.0", tk.END).strip()
     
     # Validate work order and serial number lengths
-    if len(work_order) > 10:
-        messagebox.showwarning("Input Error", "Work Order number must be 10 digits or less.")
+    if len(work_order) > WORK_ORDER_MAX_LENGTH:
+        messagebox.showwarning("Input Error", f"Work Order number must be {WORK_ORDER_MAX_LENGTH} digits or less.")
         return
-    if len(serial_number) > 8:
-        messagebox.showwarning("Input Error", "Serial Number must be 8 digits or less.")
+    if len(serial_number) > SERIAL_NUMBER_MAX_LENGTH:
+        messagebox.showwarning("Input Error", f"Serial Number must be {SERIAL_NUMBER_MAX_LENGTH} digits or less.")
         return
     
     if work_order and serial_number and status:
-        add_entry(work_order, serial_number, status, notes)
-        display_log()
-        update_dashboard()
+        key = make_key(work_order, serial_number)
+        if key in store or key in pending_adds:
+            messagebox.showwarning("Input Error", f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+            return
+
+        def added(row):
+            pending_adds.discard(key)
+            if key not in store:  # Already there if the log server pushed it first
+                store.add(row)
+            update_dashboard()
+
+        def failed(error):
+            pending_adds.discard(key)
+            if isinstance(error, ValueError):  # Includes DuplicateEntryError
+                messagebox.showwarning("Input Error", str(error))
+            else:
+                show_io_error(error)
+
+        pending_adds.add(key)
+        # Storage checks again against the log itself, which other stations may have added to
+        io_executor.submit(add_entry, storage, work_order, serial_number, status, notes,
+                           on_done=added, on_error=failed, keys=[key])
         entry_work_order.delete(0, tk.END)
         entry_serial_number.delete(0, tk.END)
         combo_status.set('')
@@ -93,80 +170,45 @@ def handle_add_entry():
 def handle_update_status():
     selected_item = tree.selection()
     if selected_item:
-        item = tree.item(selected_item)
-        if len(item['values']) == 5:
-            work_order, serial_number, _, _, _ = item['values']
+        key = tree_view.key_for(selected_item[0])
+        if key in store:
+            work_order, serial_number = key
             new_status = combo_update_status.get()
-            print(f"Selected Work Order: {work_order}, Serial Number: {serial_number}, New Status: {new_status}")  # Debugging output
             if new_status:
-                update_status(work_order, serial_number, new_status)
-                # Update the selected item's status in the treeview
-                tree.item(selected_item, values=(work_order, serial_number, new_status, item['values'][3], item['values'][4]))
+                def updated(timestamp):
+                    if timestamp is None:
+                        logger.warning("No matching entry found to update: %s / %s", work_order, serial_number)
+                        return
+                    store.set_status(key, new_status, timestamp)
+                    update_dashboard()  # Refresh dashboard
+
+                io_executor.submit(update_status, storage, work_order, serial_number, new_status, on_done=updated, keys=[key])
                 combo_update_status.set('')
             else:
                 messagebox.showwarning("Input Error", "Please select a new status.")
         else:
-            messagebox.showwarning("Data Error", "Selected entry does not have the correct number of columns.")
+            messagebox.showwarning("Data Error", "Selected entry is no longer in the log.")
     else:
         messagebox.showwarning("Selection Error", "Please select an entry to update.")
 
 def handle_delete_entry():
     selected_item = tree.selection()
     if selected_item:
-        item = tree.item(selected_item)
-        print(f"Selected item values: {item['values']}")  # Print the selected item values
-        if len(item['values']) == 5:
-            # Convert work_order and serial_number to strings
-            work_order = str(item['values'][0])  # Convert to string
-            serial_number = str(item['values'][1])  # Convert to string
-            print(f"Attempting to delete entry: Work Order: '{work_order}', Serial Number: '{serial_number}'")
-
-            # Read the current log file
-            rows = []
-            entry_found = False  # Flag to check if the entry was found
-            try:
-                with open(log_file, mode='r') as file:
-                    reader = csv.reader(file)
-                    header = next(reader)  # Read the header row
-                    rows.append(header)  # Keep the header in the rows
-                    for row in reader:
-                        # Print the row values and their types for debugging
-                        print(f"Row values: {row}, Types: {[type(value) for value in row]}")
-
-                        # Ensure all values are treated as strings
-                        row = [str(value) for value in row]  # Convert all values to strings
-                        row_work_order = row[0].strip()  # Strip whitespace
-                        row_serial_number = row[1].strip()  # Strip whitespace
-
-                        print(f"Comparing: '{row_work_order}' with '{work_order.strip()}' and '{row_serial_number}' with '{serial_number.strip()}'")
-
-                        # Only keep rows that do not match the selected entry
-                        if not (row_work_order == work_order.strip() and row_serial_number == serial_number.strip()):
-                            rows.append(row)
-                        else:
-                            entry_found = True  # Mark that we found the entry to delete
-                            print(f"Entry matched and will be deleted: {row}")
-
-                if entry_found:
-                    # Write back the updated log
-                    with open(log_file, mode='w', newline='') as file:
-                        writer = csv.writer(file)
-                        writer.writerows(rows)
-                        print("Log file updated after deletion.")
-
-                    # Remove the entry from the treeview
-                    tree.delete(selected_item)
-
-                    # Update dashboard stats
+        key = tree_view.key_for(selected_item[0])
+        if key in store:
+            work_order, serial_number = key
+
+            def deleted(found):
+                if found:
+                    # Remove the entry from the treeview and update dashboard stats
+                    store.remove(key)
                     update_dashboard()
                 else:
-                    print("No matching entry found to delete.")
                     messagebox.showwarning("Deletion Error", "No matching entry found to delete.")
-            except Exception as e:
-                print(f"An error occurred while processing the log file: {e}")
-                messagebox.showerror("File Error", f"An error occurred: {e}")
+
+            io_executor.submit(delete_entry, storage, work_order, serial_number, on_done=deleted, keys=[key])
         else:
-            messagebox.showwarning("Data Error", "Selected entry does not have the correct number of columns.")
+            messagebox.showwarning("Data Error", "Selected entry is no longer in the log.")
     else:
         messagebox.showwarning("Selection Error", "Please select an entry to delete.")
         
@@ -174,14 +216,10 @@ def handle_delete_entry():
 def handle_edit_entry():
     selected_item = tree.selection()
     if selected_item:
-        item = tree.item(selected_item)
-        if len(item['values']) == 5:
-            # Retrieve values from the selected item
-            work_order, serial_number, status, notes, _ = item['values']
-            
-            # Ensure work_order and serial_number are strings
-            work_order = str(work_order)
-            serial_number = str(serial_number)
+        key = tree_view.key_for(selected_item[0])
+        if key in store:
+            # Retrieve values from the selected record
+            work_order, serial_number, status, notes, timestamp = store.get(key)
             
             edit_window = Toplevel(root)
             edit_window.title("Edit Entry")
@@ -214,244 +252,516 @@ def handle_edit_entry():
                 new_status = edit_status.get()
                 new_notes = edit_notes.get("1.0", tk.END).strip()
                 
-                rows = []
-                with open(log_file, mode='r') as file:
-                    reader = csv.reader(file)
-                    header = next(reader)  # Read the header row
-                    rows.append(header)  # Keep the header in the rows
-                    for row in reader:
-                        # Convert row values to strings to avoid AttributeError
-                        row_work_order = str(row[0]).strip()
-                        row_serial_number = str(row[1]).strip()
-                        
-                        if row_work_order == work_order.strip() and row_serial_number == serial_number.strip():
-                            # Update the row with new values
-                            row = [new_work_order, new_serial_number, new_status, new_notes, row[4]]  # Keep the original timestamp
-                        rows.append(row)
-                
-                with open(log_file, mode='w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerows(rows)
-                
-                display_log()  # Refresh the displayed log
-                update_dashboard()  # Refresh the dashboard
-                edit_window.destroy()  # Close the edit window
+                new_key = make_key(new_work_order, new_serial_number)
+                if new_key != key and new_key in store:
+                    messagebox.showwarning("Input Error", f"Work Order {new_work_order} / Serial Number {new_serial_number} already exists", parent=edit_window)
+                    return
+
+                def saved(found):
+                    if found:
+                        store.update(key, [new_work_order, new_serial_number, new_status, new_notes, timestamp])  # Keep the original timestamp
+                        update_dashboard()  # Refresh the dashboard
+                    else:
+                        messagebox.showwarning("Data Error", "Selected entry is no longer in the log.")
+                    edit_window.destroy()  # Close the edit window
+
+                def failed(error):
+                    btn_save.config(state="normal")
+                    if isinstance(error, DuplicateEntryError):
+                        messagebox.showwarning("Input Error", str(error), parent=edit_window)
+                    else:
+                        show_io_error(error)
+
+                btn_save.config(state="disabled")
+                io_executor.submit(storage.edit, work_order, serial_number, new_work_order, new_serial_number, new_status, new_notes,
+                                   on_done=saved, on_error=failed, keys=[key, new_key])
             
             # Create and place the save button
             btn_save = ttk.Button(edit_window, text="Save", command=save_edits)
             btn_save.grid(row=4, column=0, columnspan=2, padx=5, pady=5)
         else:
-            messagebox.showwarning("Data Error", "Selected entry does not have the correct number of columns.")
+            messagebox.showwarning("Data Error", "Selected entry is no longer in the log.")
     else:
         messagebox.showwarning("Selection Error", "Please select an entry to edit.")
 
 # Function to handle refreshing the log without removing returned entries
 def handle_refresh():
     display_log()
-    update_dashboard()
 
-# Function to export log to CSV
+# Function to export the log, optionally only some statuses, a date range
+# or a work order prefix. The storage backend applies the filters and the
+# file is streamed out on the I/O executor; the file type sets the format.
 def export_to_csv():
-    export_file_path = filedialog.asksaveasfilename(defaultextension='.csv', filetypes=[("CSV files", "*.csv")])
-    if export_file_path:
-        with open(export_file_path, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Work Order', 'Serial Number', 'Status', 'Notes', 'Timestamp'])
-            with open(log_file, mode='r') as log_file_read:
-                reader = csv.reader(log_file_read)
-                next(reader)  # Skip header row
-                for row in reader:
-                    writer.writerow(row)
-        messagebox.showinfo("Export Successful", f"Log exported successfully to {export_file_path}")
-
-# Function to import log from CSV
+    export_window = Toplevel(root)
+    export_window.title("Export Log")
+
+    ttk.Label(export_window, text="Statuses:").grid(row=0, column=0, padx=5, pady=5, sticky="nw")
+    frame_statuses = ttk.Frame(export_window)
+    frame_statuses.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+    status_vars = {}
+    for index, status in enumerate(STATUSES):
+        status_vars[status] = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frame_statuses, text=status, variable=status_vars[status]).grid(row=0, column=index, padx=2, sticky="w")
+
+    ttk.Label(export_window, text="From (YYYY-MM-DD):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+    export_since = ttk.Entry(export_window)
+    export_since.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+    ttk.Label(export_window, text="Before (YYYY-MM-DD):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+    export_until = ttk.Entry(export_window)
+    export_until.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+
+    ttk.Label(export_window, text="Work Order starts with:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+    export_prefix = ttk.Entry(export_window)
+    export_prefix.grid(row=3, column=1, padx=5, pady=5, sticky="w")
+
+    include_archive = tk.BooleanVar(value=False)
+    ttk.Checkbutton(export_window, text="Include archived entries", variable=include_archive).grid(row=4, column=1, padx=5, pady=5, sticky="w")
+
+    lbl_export_progress = ttk.Label(export_window, text="")
+    lbl_export_progress.grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
+    cancel_requested = threading.Event()
+
+    def start_export():
+        statuses = [status for status, var in status_vars.items() if var.get()]
+        if not statuses:
+            messagebox.showwarning("Input Error", "Please select at least one status.", parent=export_window)
+            return
+        try:
+            log_filter = make_filter(statuses if len(statuses) < len(STATUSES) else None,
+                                     export_since.get(), export_until.get(), export_prefix.get())
+        except ValueError as e:
+            messagebox.showwarning("Input Error", str(e), parent=export_window)
+            return
+        export_file_path = filedialog.asksaveasfilename(parent=export_window, defaultextension='.csv', filetypes=[
+            ("CSV files", "*.csv"), ("Gzip-compressed CSV", "*.csv.gz"), ("Zstd-compressed CSV", "*.csv.zst"),
+            ("Parquet files", "*.parquet"), ("Arrow IPC files", "*.arrow")])
+        if not export_file_path:
+            return
+
+        def show_progress(exported):
+            lbl_export_progress.config(text=f"{exported} entries exported")
+
+        def finished(report):
+            export_window.destroy()
+            title = "Export Cancelled" if report.cancelled else "Export Successful"
+            messagebox.showinfo(title, report.summary())
+
+        def failed(error):
+            btn_export_start.config(state="normal")
+            btn_export_cancel.config(state="disabled")
+            messagebox.showerror("Export Error", f"An error occurred: {error}", parent=export_window)
+
+        btn_export_start.config(state="disabled")
+        btn_export_cancel.config(state="normal")
+        io_executor.submit(export_log, storage, export_file_path, log_filter,
+                           lambda exported: io_executor.post(show_progress, exported),
+                           cancel_requested.is_set, archive_dir if include_archive.get() else None,
+                           on_done=finished, on_error=failed)
+
+    def cancel_export():
+        cancel_requested.set()
+        btn_export_cancel.config(state="disabled", text="Cancelling...")
+
+    frame_export_buttons = ttk.Frame(export_window)
+    frame_export_buttons.grid(row=5, column=0, columnspan=2, padx=5, pady=5)
+    btn_export_start = ttk.Button(frame_export_buttons, text="Export...", command=start_export)
+    btn_export_start.grid(row=0, column=0, padx=5)
+    btn_export_cancel = ttk.Button(frame_export_buttons, text="Cancel", command=cancel_export, state="disabled")
+    btn_export_cancel.grid(row=0, column=1, padx=5)
+
+# Function to move Replaced/Returned entries that have not changed for a
+# while out of the live log into the compressed archive
+def handle_archive():
+    days = simpledialog.askinteger("Archive Closed Entries", "Archive Replaced/Returned entries unchanged for how many days?",
+                                   initialvalue=ARCHIVE_AFTER_DAYS, minvalue=1, parent=root)
+    if days:
+        def archived(report):
+            messagebox.showinfo("Archive", report.summary())
+            if report.archived:
+                display_log()
+
+        io_executor.submit(archive_closed, storage, archive_dir, days, on_done=archived)
+
+# Function to import log from CSV. The file is read and written in chunks on
+# the I/O executor while a progress window shows how far it has got.
 def import_from_csv():
     import_file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
     if import_file_path:
-        with open(import_file_path, mode='r') as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip header row
-            for row in reader:
-                add_entry(row[0], row[1], row[2], row[3])
-        display_log()
-        update_dashboard()
-        messagebox.showinfo("Import Successful", f"Log imported successfully from {import_file_path}")
-
-# Function to search log entries and highlight the closest matching entry
+        progress_window = Toplevel(root)
+        progress_window.title("Importing")
+        ttk.Label(progress_window, text=f"Importing {os.path.basename(import_file_path)}").grid(row=0, column=0, padx=10, pady=5, sticky="w")
+        progress_bar = ttk.Progressbar(progress_window, length=300, maximum=1.0)
+        progress_bar.grid(row=1, column=0, padx=10, pady=5)
+        lbl_progress = ttk.Label(progress_window, text="0 entries imported")
+        lbl_progress.grid(row=2, column=0, padx=10, pady=5, sticky="w")
+
+        cancel_requested = threading.Event()
+        existing_keys = set(store.records) | pending_adds
+        imported = 0
+
+        def cancel_import():
+            cancel_requested.set()
+            btn_cancel.config(state="disabled", text="Cancelling...")
+
+        btn_cancel = ttk.Button(progress_window, text="Cancel", command=cancel_import)
+        btn_cancel.grid(row=3, column=0, padx=10, pady=5)
+        progress_window.protocol("WM_DELETE_WINDOW", cancel_import)
+
+        # Called on the Tk thread as each chunk reaches storage
+        @traced('ui.import_chunk')
+        def imported_chunk(rows, progress):
+            nonlocal imported
+            store.add_many(rows)
+            imported += len(rows)
+            progress_bar['value'] = progress
+            lbl_progress.config(text=f"{imported} entries imported")
+            update_dashboard()
+
+        def finished(report):
+            progress_window.destroy()
+            title = "Import Cancelled" if report.cancelled else "Import Successful"
+            messagebox.showinfo(title, report.summary())
+
+        def failed(error):
+            progress_window.destroy()
+            messagebox.showerror("Import Error", f"An error occurred: {error}\n{imported} entries were imported before it.")
+
+        io_executor.submit(import_csv, import_file_path, storage, existing_keys,
+                           lambda rows, progress: io_executor.post(imported_chunk, rows, progress),
+                           cancel_requested.is_set, on_done=finished, on_error=failed)
+
+# Function to search log entries and highlight the closest matching entry.
+# Searching again for the same text moves on to the next match.
+@traced('ui.search')
 def search_log():
+    global last_search_query
     query = entry_search.get().strip().lower()
     if not query:
+        lbl_search_results.config(text="")
         return  # If search is empty, do nothing
 
-    closest_match = None
-    for item in tree.get_children():
-        values = tree.item(item, 'values')
-        if query in values[0].lower() or query in values[1].lower():
-            closest_match = item
-            break  # Stop at the first match
-
-    if closest_match:
-        tree.selection_set(closest_match)
-        tree.focus(closest_match)
-        tree.see(closest_match)  # Ensure it's visible in the view
+    after = tree_view.selected() if query == last_search_query else None
+    key, shown, hidden = tree_view.next_match(search_index.search(query), after)
+    last_search_query = query
+    if key is None:
+        lbl_search_results.config(text=f"No shown matches ({hidden} hidden by the status filter)" if hidden else "No matches")
+        return
+
+    tree_view.see(key)
+    lbl_search_results.config(text=f"Row {tree_view.position(key) + 1} of {len(tree_view)}: {shown} matches")
+
+# Function to run the search shortly after the user stops typing
+def schedule_search(event=None):
+    global search_after_id
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    search_after_id = root.after(250, run_scheduled_search)
+
+def run_scheduled_search():
+    global search_after_id
+    search_after_id = None
+    if entry_search.get().strip().lower() != last_search_query:
+        search_log()
         
-# Function to update dashboard statistics
+# Function to update dashboard statistics from the running counters
+@traced('ui.update_dashboard')
 def update_dashboard():
-    print("Updating dashboard...")
-    total_entries = 0
-    ordered_count = 0
-    pending_count = 0
-    replaced_count = 0
-    returned_count = 0
-    
-    with open(log_file, mode='r') as file:
-        reader = csv.reader(file)
-        next(reader)  # Skip header row
-        for row in reader:
-            print(row)  # Print each row to verify data
-            total_entries += 1
-            if row[2] == "Ordered":
-                ordered_count += 1
-            elif row[2] == "Pending":
-                pending_count += 1
-            elif row[2] == "Replaced":
-                replaced_count += 1
-            elif row[2] == "Returned":
-                returned_count += 1
-    
-    print(f"Total Entries: {total_entries}")
-    print(f"Ordered: {ordered_count}")
-    print(f"Pending: {pending_count}")
-    print(f"Replaced: {replaced_count}")
-    print(f"Returned: {returned_count}")
-    
-    lbl_total_entries.config(text=f"Total Entries: {total_entries}")
-    lbl_ordered_count.config(text=f"Ordered: {ordered_count}")
-    lbl_pending_count.config(text=f"Pending: {pending_count}")
-    lbl_replaced_count.config(text=f"Replaced: {replaced_count}")
-    lbl_returned_count.config(text=f"Returned: {returned_count}")
-    root.update_idletasks()
-
-# Initialize the log file
-initialize_log()
-
-# Create the main window
-root = tk.Tk()
-root.title("LCD Tracking System")
-root.geometry("1009x743")
-root.configure(bg="#f0f0f0")
-
-style = ttk.Style()
-style.configure("TLabel", background="#f0f0f0")
-style.configure("TButton", background="#4CAF50", foreground="black")
-style.configure("TCombobox", background="white")
-style.configure("Treeview.Heading", font=("Helvetica", 10, "bold"))
-
-# Create and place the search bar
-frame_search = ttk.LabelFrame(root, text="Search", padding=(10, 5))
-frame_search.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
-ttk.Label(frame_search, text="Search:").grid(row=0, column=0, padx=5, pady=5)
-entry_search = ttk.Entry(frame_search)
-entry_search.grid(row=0, column=1, padx=5, pady=5)
-
-btn_search = ttk.Button(frame_search, text="Search", command=search_log)
-btn_search.grid(row=0, column=2, padx=5, pady=5)
-
-# Create and place the refresh button and other buttons
-frame_buttons = ttk.Frame(root)
-frame_buttons.grid(row=1, column=0, padx=10, pady=10, sticky="ew")
-
-btn_refresh = ttk.Button(frame_buttons, text="Refresh Log", command=handle_refresh)
-btn_refresh.grid(row=0, column=0, padx=5, pady=5)
-
-btn_export = ttk.Button(frame_buttons, text="Export to CSV", command=export_to_csv)
-btn_export.grid(row=0, column=1, padx=5, pady=5)
-
-btn_import = ttk.Button(frame_buttons, text="Import from CSV", command=import_from_csv)
-btn_import.grid(row=0, column=2, padx=5, pady=5)
-
-# Create and place widgets for adding a new entry
-frame_add_entry = ttk.LabelFrame(root, text="Add New Entry", padding=(10, 5))
-frame_add_entry.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
-
-ttk.Label(frame_add_entry, text="Work Order:").grid(row=0, column=0, padx=5, pady=5)
-entry_work_order = ttk.Entry(frame_add_entry)
-entry_work_order.grid(row=0, column=1, padx=5, pady=5)
-
-ttk.Label(frame_add_entry, text="Serial Number:").grid(row=1, column=0, padx=5, pady=5)
-entry_serial_number = ttk.Entry(frame_add_entry)
-entry_serial_number.grid(row=1, column=1, padx=5, pady=5)
-
-ttk.Label(frame_add_entry, text="Status:").grid(row=2, column=0, padx=5, pady=5)
-combo_status = ttk.Combobox(frame_add_entry, values=["Ordered", "Pending", "Replaced", "Returned"])
-combo_status.grid(row=2, column=1, padx=5, pady=5)
-
-ttk.Label(frame_add_entry, text="Notes:").grid(row=3, column=0, padx=5, pady=5)
-text_notes = tk.Text(frame_add_entry, height=4)
-text_notes.grid(row=3, column=1, padx=5, pady=5)
-
-# Add a scrollbar to the text widget
-scrollbar_notes = ttk.Scrollbar(frame_add_entry, orient=tk.VERTICAL, command=text_notes.yview)
-text_notes.configure(yscroll=scrollbar_notes.set)
-scrollbar_notes.grid(row=3, column=2, sticky='ns')
-
-btn_add_entry = ttk.Button(frame_add_entry, text="Add Entry", command=handle_add_entry)
-btn_add_entry.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
-
-# Create and place widgets for updating the status of an entry
-frame_update_status = ttk.LabelFrame(root, text="Update Status", padding=(10, 5))
-frame_update_status.grid(row=3, column=0, padx=10, pady=10, sticky="ew")
-
-ttk.Label(frame_update_status, text="New Status:").grid(row=0, column=0, padx=5, pady=5)
-combo_update_status = ttk.Combobox(frame_update_status, values=["Ordered", "Pending", "Replaced", "Returned"])
-combo_update_status.grid(row=0, column=1, padx=5, pady=5)
-
-btn_update_status = ttk.Button(frame_update_status, text="Update Status", command=handle_update_status)
-btn_update_status.grid(row=0, column=2, padx=5, pady=5)
-
-btn_delete_entry = ttk.Button(frame_update_status, text="Delete Entry", command=handle_delete_entry)
-btn_delete_entry.grid(row=0, column=3, padx=5, pady=5)
+    lbl_total_entries.config(text=f"Total Entries: {status_counters.total}")
+    lbl_ordered_count.config(text=f"Ordered: {status_counters.counts['Ordered']}")
+    lbl_pending_count.config(text=f"Pending: {status_counters.counts['Pending']}")
+    lbl_replaced_count.config(text=f"Replaced: {status_counters.counts['Replaced']}")
+    lbl_returned_count.config(text=f"Returned: {status_counters.counts['Returned']}")
+    for (status, days), label in zip(dashboard_age_buckets, lbl_age_counts):
+        label.config(text=f"{status} > {days} days: {status_counters.older_than(status, days)}")
+    update_shown_count()
+
+# Function to show how many entries the status filter leaves in the log view
+def update_shown_count():
+    if tree_view.statuses is None:
+        lbl_shown_count.config(text="")
+    else:
+        lbl_shown_count.config(text=f"Showing {len(tree_view)} of {len(store)} entries")
+
+# Function to sort the log view by a clicked column heading: ascending, then
+# descending, then back to the order the entries were added in. Each column's
+# order is built once and kept up to date, so switching back is instant.
+@traced('ui.sort')
+def sort_by_heading(column):
+    if tree_view.sort_column != column:
+        tree_view.sort_by(column)
+    elif not tree_view.sort_reverse:
+        tree_view.sort_by(column, True)
+    else:
+        tree_view.sort_by(None)
+    for index, col in enumerate(tree_columns):
+        arrow = ""
+        if index == tree_view.sort_column:
+            arrow = " \u25bc" if tree_view.sort_reverse else " \u25b2"
+        tree.heading(col, text=col + arrow)
+
+# Function to show only the statuses ticked above the log view
+@traced('ui.filter')
+def filter_by_status():
+    shown = [status for status in STATUSES if filter_vars[status].get()]
+    tree_view.filter_statuses(None if len(shown) == len(STATUSES) else shown)
+    update_shown_count()
+
+# Function to refresh the age buckets, which change with time rather than with edits
+def refresh_dashboard_periodically():
+    update_dashboard()
+    root.after(60000, refresh_dashboard_periodically)
+
+# Function to recount the stored log and compare it with the dashboard counters
+def handle_verify_dashboard():
+    # A barrier, like a reload: the counters must match the log as it is read
+    io_executor.submit(lambda: count_statuses(storage.rows()), on_done=verified_dashboard, barrier=True,
+                       name='verify_counts')
+
+def verified_dashboard(recount):
+    mismatches = status_counters.compare(*recount)
+    if mismatches:
+        details = "\n".join(f"{name}: showing {shown}, log has {actual}" for name, (shown, actual) in mismatches.items())
+        messagebox.showwarning("Dashboard Mismatch", f"The dashboard was out of date and has been reloaded.\n{details}")
+        handle_refresh()
+    else:
+        messagebox.showinfo("Dashboard Verified", "Dashboard counts match the log.")
 
-btn_edit_entry = ttk.Button(frame_update_status, text="Edit Entry", command=handle_edit_entry)
-btn_edit_entry.grid(row=0, column=4, padx=5, pady=5)
+# Function to show the slowest recent operations and per-operation totals
+# recorded by the timing spans (LCD_TRACE=1), with an option to export them
+def show_stats_panel():
+    stats_window = Toplevel(root)
+    stats_window.title("Operation Stats")
 
-# Create and place a treeview widget for displaying the log entries
-frame_tree = ttk.Frame(root)
-frame_tree.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+    if not tracing:
+        ttk.Label(stats_window, text="Timing is off. Start the program with LCD_TRACE=1 to record operations.").grid(row=0, column=0, padx=10, pady=10)
+        return
 
-tree_columns = ("Work Order", "Serial Number", "Status", "Notes", "Timestamp")
-tree = ttk.Treeview(frame_tree, columns=tree_columns, show='headings')
-for col in tree_columns:
-    tree.heading(col, text=col)
-tree.pack(fill=tk.BOTH, expand=True)
+    ttk.Label(stats_window, text="Slowest recent operations").grid(row=0, column=0, padx=10, pady=(10, 0), sticky="w")
+    slowest_columns = ("Operation", "ms", "Rows", "Bytes", "Thread")
+    tree_slowest = ttk.Treeview(stats_window, columns=slowest_columns, show='headings', height=12)
+    for col in slowest_columns:
+        tree_slowest.heading(col, text=col)
+        tree_slowest.column(col, width=180 if col == "Operation" else 90)
+    tree_slowest.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+
+    ttk.Label(stats_window, text="Totals per operation").grid(row=2, column=0, padx=10, pady=(10, 0), sticky="w")
+    totals_columns = ("Operation", "Calls", "Total ms", "Slowest ms")
+    tree_totals = ttk.Treeview(stats_window, columns=totals_columns, show='headings', height=8)
+    for col in totals_columns:
+        tree_totals.heading(col, text=col)
+        tree_totals.column(col, width=180 if col == "Operation" else 90)
+    tree_totals.grid(row=3, column=0, padx=10, pady=5, sticky="nsew")
+
+    def refresh_stats():
+        tree_slowest.delete(*tree_slowest.get_children())
+        for span in recorder.slowest():
+            rows = span.counts.get('rows_scanned', 0) + span.counts.get('rows_written', 0)
+            data = span.counts.get('bytes_read', 0) + span.counts.get('bytes_written', 0)
+            tree_slowest.insert('', 'end', values=(span.name, f"{span.duration * 1000:.1f}", rows, data, span.thread))
+        tree_totals.delete(*tree_totals.get_children())
+        for name, calls, total, slowest in recorder.summary():
+            tree_totals.insert('', 'end', values=(name, calls, f"{total * 1000:.1f}", f"{slowest * 1000:.1f}"))
+
+    def clear_stats():
+        recorder.clear()
+        refresh_stats()
+
+    def export_trace():
+        trace_file_path = filedialog.asksaveasfilename(parent=stats_window, defaultextension='.json', filetypes=[("Trace files", "*.json")])
+        if trace_file_path:
+            recorder.export(trace_file_path)
+            messagebox.showinfo("Export Successful", f"Trace exported to {trace_file_path}\nOpen it in chrome://tracing or Perfetto.", parent=stats_window)
+
+    frame_stats_buttons = ttk.Frame(stats_window)
+    frame_stats_buttons.grid(row=4, column=0, padx=10, pady=10, sticky="w")
+    ttk.Button(frame_stats_buttons, text="Refresh", command=refresh_stats).grid(row=0, column=0, padx=5)
+    ttk.Button(frame_stats_buttons, text="Clear", command=clear_stats).grid(row=0, column=1, padx=5)
+    ttk.Button(frame_stats_buttons, text="Export Trace", command=export_trace).grid(row=0, column=2, padx=5)
+    refresh_stats()
+
+# The window is only built when this file is run, so importing it (or the
+# lcd_core library it uses) has no side effects
+if __name__ == '__main__':
+    # Log level and timing spans are set by LCD_LOG_LEVEL and LCD_TRACE
+    configure_logging()
+
+    # Initialize the log file
+    try:
+        initialize_log()
+    except OSError as e:  # Including a journal log already open at another station
+        messagebox.showerror("Storage Error", f"Could not open the log: {e}")
+        raise SystemExit(1)
+
+    # Create the main window
+    root = tk.Tk()
+    root.title("LCD Tracking System")
+    root.geometry("1009x743")
+    root.configure(bg="#f0f0f0")
+
+    # Run storage work in the background so the window never waits on the disk
+    io_executor = IOExecutor(root, on_error=show_io_error, on_busy_change=show_busy)
+    if log_server:
+        storage.listen(lambda event: io_executor.post(apply_remote_change, event))
+
+    style = ttk.Style()
+    style.configure("TLabel", background="#f0f0f0")
+    style.configure("TButton", background="#4CAF50", foreground="black")
+    style.configure("TCombobox", background="white")
+    style.configure("Treeview.Heading", font=("Helvetica", 10, "bold"))
+
+    # Create and place the search bar
+    frame_search = ttk.LabelFrame(root, text="Search", padding=(10, 5))
+    frame_search.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
+    ttk.Label(frame_search, text="Search:").grid(row=0, column=0, padx=5, pady=5)
+    entry_search = ttk.Entry(frame_search)
+    entry_search.grid(row=0, column=1, padx=5, pady=5)
+
+    btn_search = ttk.Button(frame_search, text="Search", command=search_log)
+    btn_search.grid(row=0, column=2, padx=5, pady=5)
+
+    lbl_search_results = ttk.Label(frame_search, text="")
+    lbl_search_results.grid(row=0, column=3, padx=5, pady=5)
+
+    # Search as you type; Enter jumps to the next match
+    entry_search.bind('<KeyRelease>', schedule_search)
+    entry_search.bind('<Return>', lambda event: search_log())
+
+    # Create and place the refresh button and other buttons
+    frame_buttons = ttk.Frame(root)
+    frame_buttons.grid(row=1, column=0, padx=10, pady=10, sticky="ew")
+
+    btn_refresh = ttk.Button(frame_buttons, text="Refresh Log", command=handle_refresh)
+    btn_refresh.grid(row=0, column=0, padx=5, pady=5)
+
+    btn_export = ttk.Button(frame_buttons, text="Export...", command=export_to_csv)
+    btn_export.grid(row=0, column=1, padx=5, pady=5)
+
+    btn_import = ttk.Button(frame_buttons, text="Import from CSV", command=import_from_csv)
+    btn_import.grid(row=0, column=2, padx=5, pady=5)
+
+    btn_archive = ttk.Button(frame_buttons, text="Archive...", command=handle_archive)
+    btn_archive.grid(row=0, column=3, padx=5, pady=5)
+
+    btn_stats = ttk.Button(frame_buttons, text="Stats", command=show_stats_panel)
+    btn_stats.grid(row=0, column=4, padx=5, pady=5)
+
+    # Busy indicator shown while storage work is queued
+    progress_busy = ttk.Progressbar(frame_buttons, mode="indeterminate", length=80)
+    progress_busy.grid(row=0, column=5, padx=5, pady=5)
+    progress_busy.grid_remove()
+    lbl_busy = ttk.Label(frame_buttons, text="")
+    lbl_busy.grid(row=0, column=6, padx=5, pady=5)
+
+    # Create and place widgets for adding a new entry
+    frame_add_entry = ttk.LabelFrame(root, text="Add New Entry", padding=(10, 5))
+    frame_add_entry.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
+
+    ttk.Label(frame_add_entry, text="Work Order:").grid(row=0, column=0, padx=5, pady=5)
+    entry_work_order = ttk.Entry(frame_add_entry)
+    entry_work_order.grid(row=0, column=1, padx=5, pady=5)
+
+    ttk.Label(frame_add_entry, text="Serial Number:").grid(row=1, column=0, padx=5, pady=5)
+    entry_serial_number = ttk.Entry(frame_add_entry)
+    entry_serial_number.grid(row=1, column=1, padx=5, pady=5)
+
+    ttk.Label(frame_add_entry, text="Status:").grid(row=2, column=0, padx=5, pady=5)
+    combo_status = ttk.Combobox(frame_add_entry, values=["Ordered", "Pending", "Replaced", "Returned"])
+    combo_status.grid(row=2, column=1, padx=5, pady=5)
+
+    ttk.Label(frame_add_entry, text="Notes:").grid(row=3, column=0, padx=5, pady=5)
+    text_notes = tk.Text(frame_add_entry, height=4)
+    text_notes.grid(row=3, column=1, padx=5, pady=5)
+
+    # Add a scrollbar to the text widget
+    scrollbar_notes = ttk.Scrollbar(frame_add_entry, orient=tk.VERTICAL, command=text_notes.yview)
+    text_notes.configure(yscroll=scrollbar_notes.set)
+    scrollbar_notes.grid(row=3, column=2, sticky='ns')
+
+    btn_add_entry = ttk.Button(frame_add_entry, text="Add Entry", command=handle_add_entry)
+    btn_add_entry.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+
+    # Create and place widgets for updating the status of an entry
+    frame_update_status = ttk.LabelFrame(root, text="Update Status", padding=(10, 5))
+    frame_update_status.grid(row=3, column=0, padx=10, pady=10, sticky="ew")
+
+    ttk.Label(frame_update_status, text="New Status:").grid(row=0, column=0, padx=5, pady=5)
+    combo_update_status = ttk.Combobox(frame_update_status, values=["Ordered", "Pending", "Replaced", "Returned"])
+    combo_update_status.grid(row=0, column=1, padx=5, pady=5)
+
+    btn_update_status = ttk.Button(frame_update_status, text="Update Status", command=handle_update_status)
+    btn_update_status.grid(row=0, column=2, padx=5, pady=5)
+
+    btn_delete_entry = ttk.Button(frame_update_status, text="Delete Entry", command=handle_delete_entry)
+    btn_delete_entry.grid(row=0, column=3, padx=5, pady=5)
+
+    btn_edit_entry = ttk.Button(frame_update_status, text="Edit Entry", command=handle_edit_entry)
+    btn_edit_entry.grid(row=0, column=4, padx=5, pady=5)
+
+    # Create and place a treeview widget for displaying the log entries
+    frame_tree = ttk.Frame(root)
+    frame_tree.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+
+    # Status filter toggles for the log view
+    frame_filter = ttk.Frame(frame_tree)
+    frame_filter.pack(side=tk.TOP, fill=tk.X)
+    ttk.Label(frame_filter, text="Show:").pack(side=tk.LEFT, padx=5)
+    filter_vars = {}
+    for status in STATUSES:
+        filter_vars[status] = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frame_filter, text=status, variable=filter_vars[status], command=filter_by_status).pack(side=tk.LEFT, padx=2)
+    lbl_shown_count = ttk.Label(frame_filter, text="")
+    lbl_shown_count.pack(side=tk.LEFT, padx=10)
 
-# Add a scrollbar to the treeview
-scrollbar = ttk.Scrollbar(frame_tree, orient=tk.VERTICAL, command=tree.yview)
-tree.configure(yscroll=scrollbar.set)
-scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    # Click a heading to sort by that column
+    tree_columns = ("Work Order", "Serial Number", "Status", "Notes", "Timestamp")
+    tree = ttk.Treeview(frame_tree, columns=tree_columns, show='headings')
+    for index, col in enumerate(tree_columns):
+        tree.heading(col, text=col, command=lambda column=index: sort_by_heading(column))
+    tree.pack(fill=tk.BOTH, expand=True)
 
-# Create and place dashboard for summary statistics
-frame_dashboard = ttk.LabelFrame(root, text="Dashboard", padding=(10, 5))
-frame_dashboard.grid(row=0, column=1, rowspan=4, padx=10, pady=10, sticky="nsew")
+    # Add a scrollbar to the treeview
+    scrollbar = ttk.Scrollbar(frame_tree, orient=tk.VERTICAL)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-lbl_total_entries = ttk.Label(frame_dashboard, text="Total Entries: 0", font=("Helvetica", 10, "bold"))
-lbl_total_entries.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+    # Only the rows on screen (plus a margin) exist as Treeview items
+    tree_view = VirtualTreeview(tree, scrollbar)
+    store.subscribe(tree_view)
 
-lbl_ordered_count = ttk.Label(frame_dashboard, text="Ordered: 0", font=("Helvetica", 10, "bold"))
-lbl_ordered_count.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+    # Create and place dashboard for summary statistics
+    frame_dashboard = ttk.LabelFrame(root, text="Dashboard", padding=(10, 5))
+    frame_dashboard.grid(row=0, column=1, rowspan=4, padx=10, pady=10, sticky="nsew")
 
-lbl_pending_count = ttk.Label(frame_dashboard, text="Pending: 0", font=("Helvetica", 10, "bold"))
-lbl_pending_count.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+    lbl_total_entries = ttk.Label(frame_dashboard, text="Total Entries: 0", font=("Helvetica", 10, "bold"))
+    lbl_total_entries.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 
-lbl_replaced_count = ttk.Label(frame_dashboard, text="Replaced: 0", font=("Helvetica", 10, "bold"))
-lbl_replaced_count.grid(row=3, column=0, padx=5, pady=5, sticky="w")
+    lbl_ordered_count = ttk.Label(frame_dashboard, text="Ordered: 0", font=("Helvetica", 10, "bold"))
+    lbl_ordered_count.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+
+    lbl_pending_count = ttk.Label(frame_dashboard, text="Pending: 0", font=("Helvetica", 10, "bold"))
+    lbl_pending_count.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+
+    lbl_replaced_count = ttk.Label(frame_dashboard, text="Replaced: 0", font=("Helvetica", 10, "bold"))
+    lbl_replaced_count.grid(row=3, column=0, padx=5, pady=5, sticky="w")
+
+    lbl_returned_count = ttk.Label(frame_dashboard, text="Returned: 0", font=("Helvetica", 10, "bold"))
+    lbl_returned_count.grid(row=4, column=0, padx=5, pady=5, sticky="w")
+
+    lbl_age_counts = []
+    for index, (status, days) in enumerate(dashboard_age_buckets):
+        lbl_age_count = ttk.Label(frame_dashboard, text=f"{status} > {days} days: 0")
+        lbl_age_count.grid(row=5 + index, column=0, padx=5, pady=5, sticky="w")
+        lbl_age_counts.append(lbl_age_count)
 
-lbl_returned_count = ttk.Label(frame_dashboard, text="Returned: 0", font=("Helvetica", 10, "bold"))
-lbl_returned_count.grid(row=4, column=0, padx=5, pady=5, sticky="w")
+    btn_verify_dashboard = ttk.Button(frame_dashboard, text="Verify Counts", command=handle_verify_dashboard)
+    btn_verify_dashboard.grid(row=5 + len(dashboard_age_buckets), column=0, padx=5, pady=5, sticky="w")
 
-# Display the initial log entries and update dashboard
-display_log()
-update_dashboard()
+    # Display the initial log entries and update dashboard
+    display_log()
+    refresh_dashboard_periodically()
 
-# Run the application
-root.mainloop()
\ No newline at end of file
+    # Run the application
+    root.mainloop()
+    io_executor.shutdown()
+    storage.close()
@@ -0,0 +1,72 @@
+# Benchmark: memory held by the in-memory log, per entry, for the old
+# representation (a dict of key -> list of five strings, as csv.reader
+# returns them) and for RecordStore's Records (fixed slots, status as a
+# small int, shared work order strings). Rows come from generate_log.py and
+# are written to and read back from a CSV file first, so every string is a
+# fresh object, the same as when the GUI loads a log.
+#
+#   python benchmarks/bench_memory.py [--sizes 10000 100000 1000000]
+#
+# Memory is measured with tracemalloc and includes the dict and key tuples.
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_log import generate_rows
+from lcd_model import RecordStore
+from lcd_storage import CsvStorage, make_key, write_log_file
+
+
+def load_lists(rows):
+    records = {}
+    for row in rows:
+        records[make_key(row[0], row[1])] = list(row)
+    return records
+
+
+def load_records(rows):
+    store = RecordStore()
+    store.load(rows)
+    return store
+
+
+# Bytes allocated by load(rows) that are still held by its result, and the
+# seconds it took plus the time of a full gc.collect() afterwards
+def measure(load, path):
+    storage = CsvStorage(path)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load(storage.rows())
+    load_seconds = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    gc.collect()
+    gc_seconds = time.perf_counter() - start
+    del result
+    return held, load_seconds, gc_seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare memory per log entry of lists and Records.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'lists B/row':>12} {'Records B/row':>14} {'saved':>6} "
+          f"{'lists load s':>13} {'Records load s':>15} {'lists gc s':>11} {'Records gc s':>13}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in args.sizes:
+            path = os.path.join(workdir, f"lcd_log_{count}.csv")
+            write_log_file(path, generate_rows(count))
+            lists = measure(load_lists, path)
+            records = measure(load_records, path)
+            print(f"{count:>8} {lists[0] / count:>12.0f} {records[0] / count:>14.0f} "
+                  f"{1 - records[0] / lists[0]:>6.0%} {lists[1]:>13.2f} {records[1]:>15.2f} "
+                  f"{lists[2]:>11.3f} {records[2]:>13.3f}")
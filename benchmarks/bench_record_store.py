@@ -0,0 +1,69 @@
+# Benchmark: per-operation latency of adding, updating and deleting one entry
+# through RecordStore + VirtualTreeview, compared with the old approach of
+# reloading every row into the Treeview after each change.
+#
+#   python benchmarks/bench_record_store.py [row counts...]
+#
+# Uses a real ttk.Treeview when a display is available and the stand-in
+# widget from bench_tracker otherwise.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_tracker import StubScrollbar, StubTree
+from lcd_model import RecordStore
+from lcd_view import VirtualTreeview
+
+STATUSES = ["Ordered", "Pending", "Replaced", "Returned"]
+
+
+def make_tree():
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+        root.withdraw()
+        tree = ttk.Treeview(root, columns=("a", "b", "c", "d", "e"), show='headings')
+        return tree, ttk.Scrollbar(root), "ttk.Treeview"
+    except Exception:
+        return StubTree(), StubScrollbar(), "StubTree (no display)"
+
+
+def make_rows(count):
+    return [[f"{100000 + i}", f"S{i:07d}", STATUSES[i % 4], "note", "2024-01-01 00:00:00"] for i in range(count)]
+
+
+# Average seconds per call of operation over repeat runs
+def time_per_op(operation, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        operation(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def run(count, tree, scrollbar, repeat=200):
+    store = RecordStore()
+    store.subscribe(VirtualTreeview(tree, scrollbar))
+    rows = make_rows(count)
+    store.load(rows)
+
+    results = {}
+    results['add'] = time_per_op(lambda i: store.add([f"X{i}", f"N{i}", "Ordered", "", "t"]), repeat)
+    results['set_status'] = time_per_op(lambda i: store.set_status((rows[i][0], rows[i][1]), "Replaced", "t"), repeat)
+    results['remove'] = time_per_op(lambda i: store.remove((f"X{i}", f"N{i}")), repeat)
+    # One full reload is what every change used to cost
+    results['full reload'] = time_per_op(lambda i: store.load(rows), 3)
+    return results
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    tree, scrollbar, kind = make_tree()
+    print(f"Tree: {kind}")
+    print(f"{'rows':>8} {'add':>10} {'set_status':>12} {'remove':>10} {'full reload':>12}  (ms per op)")
+    for count in counts:
+        results = run(count, tree, scrollbar)
+        print(f"{count:>8} {results['add'] * 1000:>10.3f} {results['set_status'] * 1000:>12.3f} "
+              f"{results['remove'] * 1000:>10.3f} {results['full reload'] * 1000:>12.1f}")
@@ -0,0 +1,196 @@
+# Benchmark and convergence check for several stations writing one log at
+# once, each station being its own process:
+#
+#   server  a log server (lcd_sync.py) is started and every station talks to
+#           it through RemoteStorage, following the change feed with a
+#           RecordStore as the GUI does
+#   csv     every station opens the same CSV log directly (CsvStorage),
+#           relying on the file lock
+#
+# Each station adds entries of its own, tries to add a set of keys that all
+# stations race for, and changes the status of random entries, its own and
+# the others'. Afterwards the log must hold every successful add once, each
+# raced key exactly once, and (server mode) every station's store must match
+# the server's log.
+#
+#   python benchmarks/bench_sync.py [--mode server] [--clients 3] [--ops 50]
+#
+# Exits with status 1 if anything did not converge.
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lcd_core import add_entry, update_status
+from lcd_model import STATUSES, RecordStore
+from lcd_storage import CsvStorage, DuplicateEntryError, make_key
+from lcd_sync import RemoteStorage, apply_change
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(address, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(address).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+# The writes one station makes: ops adds of its own keys, an attempt at every
+# raced key, and ops status changes of random keys, in a shuffled order
+def station_ops(index, ops, raced, seed):
+    rng = random.Random(seed * 1000 + index)
+    own = [('add', (f"S{index}", f"{n:06d}")) for n in range(ops)]
+    race = [('add', key) for key in raced]
+    updates = [('status', None)] * ops
+    plan = own + race + updates
+    rng.shuffle(plan)
+    return rng, plan
+
+
+# Runs in a station process. Returns (keys it added, duplicates refused,
+# status changes made, seconds, rows of its store, rows the log holds).
+def run_station(mode, target, index, clients, ops, raced, seed, start):
+    if mode == 'server':
+        storage = RemoteStorage(target)
+        storage.initialize()
+        store = RecordStore()
+        store_lock = threading.Lock()
+
+        # Change events arrive on the connection's reader thread
+        def on_change(event):
+            with store_lock:
+                apply_change(store, event)
+        storage.listen(on_change)
+        storage.request_snapshot()
+    else:
+        storage = CsvStorage(target)
+        store = None
+
+    rng, plan = station_ops(index, ops, raced, seed)
+    added = []
+    duplicates = 0
+    changed = 0
+    start.wait()
+    began = time.perf_counter()
+    for op, key in plan:
+        if op == 'add':
+            try:
+                add_entry(storage, key[0], key[1], rng.choice(STATUSES), f"station {index}")
+                added.append(key)
+            except DuplicateEntryError:
+                duplicates += 1
+        else:
+            owner = rng.randrange(clients)
+            key = (f"S{owner}", f"{rng.randrange(ops):06d}")
+            if update_status(storage, key[0], key[1], rng.choice(STATUSES)) is not None:
+                changed += 1
+    seconds = time.perf_counter() - began
+    start.wait()  # Every station has finished writing
+
+    store_rows = None
+    log_rows = sorted(tuple(row) for row in storage.rows())
+    if store is not None:
+        # The server sent every change event before answering rows(), and
+        # they are applied in order on the reader thread before it returns
+        with store_lock:
+            store_rows = sorted(tuple(row) for row in store.rows())
+    storage.close()
+    return added, duplicates, changed, seconds, store_rows, log_rows
+
+
+def station_main(args):
+    return run_station(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that several station processes writing one log converge.")
+    parser.add_argument('--mode', choices=['server', 'csv'], default='server')
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--ops', type=int, default=50, help="adds and status changes per station")
+    parser.add_argument('--raced', type=int, default=10, help="keys every station tries to add")
+    parser.add_argument('--storage', default='csv', choices=['csv', 'sqlite', 'journal'],
+                        help="backend behind the log server")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    raced = [("R", f"{n:06d}") for n in range(args.raced)]
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, 'lcd_log.csv')
+        server = None
+        if args.mode == 'server':
+            address = ('127.0.0.1', free_port())
+            server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'lcd_sync.py'), '--listen',
+                                       f"{address[0]}:{address[1]}", '--log', log_path, '--storage', args.storage],
+                                      stderr=subprocess.DEVNULL)
+            wait_for_server(address)
+            target = address
+        else:
+            CsvStorage(log_path).initialize()
+            target = log_path
+
+        try:
+            with multiprocessing.Manager() as manager:
+                start = manager.Barrier(args.clients + 1)
+                with multiprocessing.Pool(args.clients) as pool:
+                    pending = pool.map_async(station_main, [(args.mode, target, index, args.clients, args.ops, raced, args.seed, start)
+                                                            for index in range(args.clients)])
+                    start.wait()  # Go
+                    began = time.perf_counter()
+                    start.wait()  # All stations done writing
+                    elapsed = time.perf_counter() - began
+                    results = pending.get()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    problems = []
+    added = [key for result in results for key in result[0]]
+    log_rows = results[0][5]
+    log_keys = [make_key(row[0], row[1]) for row in log_rows]
+    if len(log_keys) != len(set(log_keys)):
+        problems.append(f"{len(log_keys) - len(set(log_keys))} duplicate keys in the log")
+    if sorted(added) != sorted(log_keys):
+        problems.append(f"the log holds {len(log_keys)} entries but {len(added)} adds succeeded")
+    for key in raced:
+        winners = added.count(key)
+        if winners != 1:
+            problems.append(f"raced key {key[0]} / {key[1]} was added {winners} times")
+    for index, result in enumerate(results):
+        if result[5] != log_rows:
+            problems.append(f"station {index} read a different log")
+        if result[4] is not None and result[4] != log_rows:
+            problems.append(f"station {index}'s store differs from the log")
+
+    writes = sum(len(result[0]) + result[1] + result[2] for result in results)
+    print(f"{args.clients} stations ({args.mode}): {len(added)} adds, {sum(result[1] for result in results)} duplicates "
+          f"refused, {sum(result[2] for result in results)} status changes in {elapsed:.2f} s "
+          f"({writes / elapsed:.0f} writes/s)")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print(f"OK: every station converged on the same {len(log_rows)} entries")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
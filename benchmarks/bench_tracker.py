@@ -0,0 +1,264 @@
+# Benchmark: the tracker's hot paths on synthetic logs (see generate_log.py),
+# timed headlessly. Each operation runs the same code as its GUI handler:
+#
+#   add_entry      lcd_core.add_entry + RecordStore.add
+#   update_status  lcd_core.update_status + RecordStore.set_status
+#   delete_entry   lcd_core.delete_entry + RecordStore.remove
+#   display_log    storage.rows() + RecordStore.load
+#   tail_log       lcd_core.tail_log (newest 20 entries)
+#   select_filtered  storage.select for Pending entries of the last 30 days
+#   update_dashboard  running counts + age buckets
+#   search_log     SearchIndex.search + jump to the first match
+#   sort_switch    VirtualTreeview.sort_by between Timestamp (built once
+#                  beforehand) and the order added, up and down
+#   filter_status  VirtualTreeview.filter_statuses, cycling through a few filters
+#   import_csv     lcd_import.import_csv + RecordStore.add_many
+#
+# with the Treeview, dashboard counters and search index subscribed, the
+# Treeview being a stand-in widget so no display is needed.
+#
+#   python benchmarks/bench_tracker.py [--sizes 10000 100000 1000000] [--storage csv]
+#                                      [--output results.json] [--compare previous.json]
+#
+# Results are written as JSON (milliseconds per call) so runs can be compared.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_log import generate_rows
+from lcd_core import add_entry, delete_entry, tail_log, update_status
+from lcd_import import import_csv
+from lcd_model import RecordStore, StatusCounters
+from lcd_search import SearchIndex
+from lcd_storage import LogFilter, open_storage, write_log_file
+from lcd_view import VirtualTreeview
+
+# Same buckets as the GUI dashboard
+DASHBOARD_AGE_BUCKETS = [("Ordered", 7), ("Pending", 7), ("Pending", 30)]
+
+
+# Stand-in for ttk.Treeview with the calls VirtualTreeview makes, showing
+# visible_rows rows at a time
+class StubTree:
+    def __init__(self, visible_rows=25):
+        self.visible_rows = visible_rows
+        self.values = {}
+        self.order = []
+        self.top = 0
+        self.selected = ()
+        self.next_id = 0
+        self.on_scroll = None
+
+    def configure(self, yscrollcommand=None, **options):
+        self.on_scroll = yscrollcommand or self.on_scroll
+
+    def insert(self, parent, index, values=()):
+        self.next_id += 1
+        item = f"I{self.next_id:06X}"
+        self.values[item] = values
+        self.order.append(item)
+        return item
+
+    def item(self, item, values=None):
+        if values is not None:
+            self.values[item] = values
+        return {'values': self.values[item]}
+
+    def delete(self, *items):
+        for item in items:
+            del self.values[item]
+        self.order = [item for item in self.order if item in self.values]
+
+    def yview(self):
+        count = len(self.order)
+        if not count:
+            return 0.0, 1.0
+        return self.top / count, min(count, self.top + self.visible_rows) / count
+
+    def yview_moveto(self, fraction):
+        count = len(self.order)
+        self.top = max(0, min(round(fraction * count), count - self.visible_rows))
+        if self.on_scroll:
+            self.on_scroll(*self.yview())
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, item):
+        self.selected = (item,)
+
+    def selection_remove(self, *items):
+        self.selected = ()
+
+    def focus(self, item=None):
+        pass
+
+    def see(self, item):
+        pass
+
+
+class StubScrollbar:
+    def configure(self, **options):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+# Time operation(i) for i = 0, 1, ... until budget seconds have passed
+# (at least min_runs and at most max_runs calls). Returns milliseconds.
+def measure(operation, budget, max_runs=200, min_runs=3):
+    times = []
+    while len(times) < max_runs and (len(times) < min_runs or sum(times) < budget):
+        start = time.perf_counter()
+        operation(len(times))
+        times.append(time.perf_counter() - start)
+    return {
+        'runs': len(times),
+        'mean_ms': sum(times) / len(times) * 1000,
+        'min_ms': min(times) * 1000,
+        'max_ms': max(times) * 1000,
+    }
+
+
+def run(count, backend, workdir, budget, seed):
+    path = os.path.join(workdir, f"lcd_log_{count}.csv")
+    write_log_file(path, generate_rows(count, seed))
+    storage = open_storage(backend, path)
+
+    store = RecordStore()
+    status_counters = StatusCounters()
+    search_index = SearchIndex()
+    tree_view = VirtualTreeview(StubTree(), StubScrollbar())
+    for listener in (status_counters, search_index, tree_view):
+        store.subscribe(listener)
+
+    results = {}
+    try:
+        results['display_log'] = measure(lambda i: store.load(list(storage.rows())), budget, max_runs=5, min_runs=1)
+        keys = list(store.records)
+        results['tail_log'] = measure(lambda i: tail_log(storage, 20), budget)
+        recent = LogFilter(["Pending"], since=(datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d"))
+        results['select_filtered'] = measure(lambda i: list(storage.select(recent)), budget, max_runs=5, min_runs=1)
+
+        def add(i):
+            row = add_entry(storage, f"9{i:07d}", f"{i:08d}", "Ordered", "bench entry")
+            store.add(row)
+        results['add_entry'] = measure(add, budget)
+
+        def set_status(i):
+            key = keys[(i * 7919) % len(keys)]
+            status = "Replaced" if i % 2 else "Returned"
+            timestamp = update_status(storage, key[0], key[1], status)
+            store.set_status(key, status, timestamp)
+        results['update_status'] = measure(set_status, budget)
+
+        # Delete the entries added above
+        def delete(i):
+            key = (f"9{i:07d}", f"{i:08d}")
+            delete_entry(storage, *key)
+            store.remove(key)
+        results['delete_entry'] = measure(delete, budget, max_runs=results['add_entry']['runs'])
+
+        def dashboard(i):
+            labels = [f"Total Entries: {status_counters.total}"]
+            labels += [f"{status}: {total}" for status, total in status_counters.counts.items()]
+            labels += [f"{status} > {days} days: {status_counters.older_than(status, days)}"
+                       for status, days in DASHBOARD_AGE_BUCKETS]
+            return labels
+        results['update_dashboard'] = measure(dashboard, budget, max_runs=1000)
+
+        sample = store.get(keys[len(keys) // 2])
+        queries = [sample[1][:2], sample[0][-4:], sample[1], "bezel", "cracked panel", "no such text"]
+
+        def search(i):
+            key = tree_view.next_match(search_index.search(queries[i % len(queries)]), tree_view.selected())[0]
+            if key is not None:
+                tree_view.see(key)
+        results['search_log'] = measure(search, budget, max_runs=len(queries) * 20)
+
+        tree_view.sort_by(4)
+        results['sort_switch'] = measure(lambda i: tree_view.sort_by(4 if i % 2 else None, i % 4 >= 2), budget)
+        filters = [{"Pending"}, {"Ordered", "Pending"}, {"Replaced", "Returned"}, None]
+        results['filter_status'] = measure(lambda i: tree_view.filter_statuses(filters[i % len(filters)]), budget)
+        tree_view.sort_by(None)
+        tree_view.filter_statuses(None)
+
+        # Import a tenth as many new rows (at most 100000) in one go
+        import_count = min(100000, max(1, count // 10))
+        import_path = os.path.join(workdir, f"import_{count}.csv")
+        write_log_file(import_path, generate_rows(import_count, seed + 1, first_work_order=7000000))
+        results['import_csv'] = measure(
+            lambda i: import_csv(import_path, storage, set(store.records), lambda rows, progress: store.add_many(rows)),
+            budget, max_runs=1, min_runs=1)
+        results['import_csv']['rows'] = import_count
+    finally:
+        storage.close()
+    return results
+
+
+# Function to describe the machine and code a run was made on
+def describe_run(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': args.storage,
+        'seed': args.seed,
+        'budget_s': args.budget,
+    }
+
+
+def print_results(results, previous=None):
+    operations = list(next(iter(results.values())))
+    print(f"{'rows':>8} " + " ".join(f"{operation:>16}" for operation in operations) + "  (ms per call)")
+    for count, timings in results.items():
+        cells = []
+        for operation in operations:
+            cell = f"{timings[operation]['mean_ms']:.3f}"
+            old = (previous or {}).get(count, {}).get(operation)
+            if old:
+                cell += f" {timings[operation]['mean_ms'] / old['mean_ms']:.2f}x"
+            cells.append(f"{cell:>16}")
+        print(f"{count:>8} " + " ".join(cells))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the tracker's hot paths on synthetic logs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--storage', default='csv', choices=['csv', 'sqlite', 'journal'])
+    parser.add_argument('--budget', type=float, default=1.0, help="seconds to spend timing each operation")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_tracker_results.json', help="JSON file to write results to")
+    parser.add_argument('--compare', help="earlier results file; timings are shown as a ratio against it")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in args.sizes:
+            print(f"Running {count} rows...", file=sys.stderr)
+            results[str(count)] = run(count, args.storage, workdir, args.budget, args.seed)
+
+    with open(args.output, mode='w') as file:
+        json.dump({'run': describe_run(args), 'results': results}, file, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)['results']
+    print_results(results, previous)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,84 @@
+# Synthetic LCD log generator for benchmarks and load testing.
+#
+#   python benchmarks/generate_log.py 100000 [-o lcd_log_100k.csv] [--seed 1]
+#
+# Rows look like a real shop-floor log: timestamps spread over the past year
+# in the order they were logged, work orders that cover one to several LCDs,
+# 8-digit serial numbers, a status mix that leans towards Ordered/Pending for
+# recent entries and Replaced/Returned for older ones, and notes that are
+# mostly empty or short with the occasional long one.
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lcd_storage import TIMESTAMP_FORMAT, write_log_file
+
+# Status weights for entries logged in the last 30 days and for older ones
+RECENT_STATUS_WEIGHTS = {"Ordered": 35, "Pending": 40, "Replaced": 20, "Returned": 5}
+OLDER_STATUS_WEIGHTS = {"Ordered": 3, "Pending": 7, "Replaced": 65, "Returned": 25}
+
+# How many LCDs one work order covers, with weights
+SERIALS_PER_WORK_ORDER = {1: 60, 2: 25, 3: 10, 4: 3, 6: 1, 8: 1}
+
+NOTE_WORDS = ("cracked bezel dead pixels backlight flicker no display vendor rma pending customer "
+              "called warranty expired shipped received tested ok replaced panel hinge cable loose "
+              "lines vertical horizontal touch not responding burn in water damage dropped screen "
+              "ordered from supplier awaiting parts escalated tech bench").split()
+
+
+# Function to make a note: ~40% empty, ~45% a few words, ~15% a long one
+def make_note(rng):
+    kind = rng.random()
+    if kind < 0.40:
+        return ""
+    count = rng.randint(2, 8) if kind < 0.85 else rng.randint(15, 40)
+    return " ".join(rng.choice(NOTE_WORDS) for _ in range(count))
+
+
+# Function to generate count log rows. first_work_order sets the work order
+# numbering, so logs made with different values never share a key.
+def generate_rows(count, seed=0, first_work_order=2400000, days=365, now=None):
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    start = now - timedelta(days=days)
+    step = timedelta(days=days) / max(1, count)
+    sizes = list(SERIALS_PER_WORK_ORDER)
+    size_weights = list(SERIALS_PER_WORK_ORDER.values())
+    statuses = list(RECENT_STATUS_WEIGHTS)
+    recent_weights = [RECENT_STATUS_WEIGHTS[status] for status in statuses]
+    older_weights = [OLDER_STATUS_WEIGHTS[status] for status in statuses]
+    recent_cutoff = now - timedelta(days=30)
+    serials = set()
+    work_order = first_work_order
+    remaining = 0
+    rows = []
+    for i in range(count):
+        if remaining == 0:
+            work_order += rng.randint(1, 3)
+            remaining = rng.choices(sizes, size_weights)[0]
+        remaining -= 1
+        while True:
+            serial_number = str(rng.randrange(10000000, 100000000))
+            if serial_number not in serials:
+                serials.add(serial_number)
+                break
+        when = start + step * i
+        status = rng.choices(statuses, recent_weights if when >= recent_cutoff else older_weights)[0]
+        rows.append([str(work_order), serial_number, status, make_note(rng), when.strftime(TIMESTAMP_FORMAT)])
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic LCD log for benchmarking.")
+    parser.add_argument('count', type=int, help="number of rows")
+    parser.add_argument('-o', '--output', help="file to write (default: lcd_log_<count>.csv)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    output = args.output or f"lcd_log_{args.count}.csv"
+    write_log_file(output, generate_rows(args.count, args.seed))
+    print(f"Wrote {args.count} rows to {output}")
@@ -0,0 +1,161 @@
+import csv
+import gzip
+import io
+import os
+from datetime import datetime, timedelta
+
+from lcd_storage import LOG_HEADER, TIMESTAMP_FORMAT, LogFilter, make_key
+from lcd_trace import logger, span
+
+# Archive tier for closed records. Entries that are Replaced or Returned and
+# have not changed for ARCHIVE_AFTER_DAYS are moved out of the live log into
+# gzip-compressed CSV partitions, one per month of their timestamp
+# (lcd_log_archive/2024-05.csv.gz), which are left read-only. Time-range
+# queries open only the partitions that overlap the range.
+
+CLOSED_STATUSES = ["Replaced", "Returned"]
+ARCHIVE_AFTER_DAYS = 365
+
+
+class ArchiveReport:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.archived = 0
+        self.skipped = 0  # changed or deleted while being archived, so left alone
+        self.partitions = []
+
+    def summary(self):
+        skipped = (f" {self.skipped} entries changed or were deleted while they were being archived and were left alone."
+                   if self.skipped else "")
+        if not self.archived:
+            return ("No closed entries were archived." + skipped) if skipped else "No closed entries were old enough to archive."
+        return (f"{self.archived} closed entries moved to {len(self.partitions)} archive partitions "
+                f"in {self.archive_dir} ({', '.join(self.partitions)})." + skipped)
+
+
+# Function to name the archive directory kept next to a log file
+def archive_dir_for(log_path):
+    return os.path.splitext(log_path)[0] + '_archive'
+
+
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, month + '.csv.gz')
+
+
+# Function to list the archive partitions as (month, path), oldest first
+def list_partitions(archive_dir):
+    if not os.path.isdir(archive_dir):
+        return []
+    return [(name[:-len('.csv.gz')], os.path.join(archive_dir, name))
+            for name in sorted(os.listdir(archive_dir)) if name.endswith('.csv.gz')]
+
+
+def read_partition(path):
+    with gzip.open(path, mode='rt', encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip header row
+        for row in reader:
+            if len(row) == 5:
+                yield row
+
+
+# Write a partition under a temporary name, then swap it in read-only
+def write_partition(path, rows):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as binary, io.TextIOWrapper(binary, encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(LOG_HEADER)
+            writer.writerows(rows)
+        raw.flush()
+        os.fsync(raw.fileno())
+    if os.path.exists(path):
+        os.chmod(path, 0o644)  # Windows will not replace a read-only file
+    os.replace(tmp_path, path)
+    os.chmod(path, 0o444)
+
+
+# Function to rewrite a partition with rows, oldest first, or remove it if
+# there are none left
+def write_partition_or_remove(path, rows):
+    rows = sorted(rows, key=lambda row: row[4])
+    if rows:
+        write_partition(path, rows)
+    else:
+        os.chmod(path, 0o644)  # Windows will not remove a read-only file
+        os.remove(path)
+
+
+# Function to move closed entries older than days from storage into the
+# archive. Partitions are written (merged with any earlier archive of the
+# same month) before the entries are deleted from the live log, so a crash
+# in between leaves them in both places rather than in neither; archiving
+# again later merges them by key. An entry is only deleted if it is still
+# exactly the row that was archived; one that was changed (or deleted) in the
+# meantime is taken back out of its partition and counted as skipped.
+def archive_closed(storage, archive_dir, days=ARCHIVE_AFTER_DAYS, now=None):
+    cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+    report = ArchiveReport(archive_dir)
+    with span('archive', days=days) as trace:
+        by_month = {}
+        for row in storage.select(LogFilter(CLOSED_STATUSES, until=cutoff)):
+            try:
+                datetime.strptime(row[4], TIMESTAMP_FORMAT)
+            except ValueError:
+                continue  # A row without a real timestamp cannot be placed in a partition
+            by_month.setdefault(row[4][:7], []).append(row)
+        if not by_month:
+            return report
+
+        os.makedirs(archive_dir, exist_ok=True)
+        partitions = {}  # month -> (rows before this run, rows written)
+        for month, rows in sorted(by_month.items()):
+            path = partition_path(archive_dir, month)
+            before = {}
+            if os.path.exists(path):
+                for row in read_partition(path):
+                    before[make_key(row[0], row[1])] = row
+            merged = dict(before)
+            for row in rows:
+                merged[make_key(row[0], row[1])] = row
+            write_partition_or_remove(path, merged.values())
+            partitions[month] = (before, merged)
+            trace.count(rows_written=len(merged), bytes_written=os.path.getsize(path))
+
+        expected = {make_key(row[0], row[1]): row for rows in by_month.values() for row in rows}
+        deleted = storage.delete_many(set(expected), expected)
+        report.archived = len(deleted)
+        report.skipped = len(expected) - len(deleted)
+        for month, rows in sorted(by_month.items()):
+            before, merged = partitions[month]
+            skipped = [make_key(row[0], row[1]) for row in rows if make_key(row[0], row[1]) not in deleted]
+            if skipped:
+                for key in skipped:
+                    if key in before:
+                        merged[key] = before[key]
+                    else:
+                        del merged[key]
+                write_partition_or_remove(partition_path(archive_dir, month), merged.values())
+            if any(make_key(row[0], row[1]) in deleted for row in rows):
+                report.partitions.append(month)
+        if report.skipped:
+            logger.warning("%d entries changed or were deleted while they were being archived; left them alone",
+                           report.skipped)
+        logger.info("Archived %d entries into %s", report.archived, archive_dir)
+    return report
+
+
+# Function to read archived rows matching log_filter, opening only the
+# partitions whose month overlaps the filter's time range
+def archived_rows(archive_dir, log_filter=None):
+    log_filter = log_filter or LogFilter()
+    with span('archive.read') as trace:
+        for month, path in list_partitions(archive_dir):
+            if log_filter.since is not None and month < log_filter.since[:7]:
+                continue
+            if log_filter.until is not None and month + '-01' >= log_filter.until:
+                continue
+            trace.count(partitions=1)
+            for row in read_partition(path):
+                if log_filter.matches(row):
+                    yield row
@@ -0,0 +1,340 @@
+import bisect
+import contextlib
+import csv
+import io
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from lcd_mmap import MappedLog, count_rewrite, read_range
+from lcd_model import STATUS_BY_NAME, STATUSES
+from lcd_storage import (LOG_HEADER, SERIAL_NUMBER_MAX_LENGTH, TIMESTAMP_FORMAT, WORK_ORDER_MAX_LENGTH, FileLock,
+                         make_key)
+from lcd_trace import logger, span
+
+# Integrity check and repair of a CSV log. The log is split into chunks of
+# rows through its row index (lcd_mmap) and the chunks are checked on a
+# process pool; the only serial step is matching keys across chunks to find
+# duplicates. A repair runs a second parallel pass that writes each chunk's
+# repaired rows to a part file, and the parts are joined in order.
+#
+# Problems and what a repair does about them:
+#   columns        trailing empty columns are dropped; otherwise the row is removed
+#   blank          blank lines are dropped
+#   missing        no work order, serial number or status: removed
+#   work_order     longer than the Add New Entry form allows: removed
+#   serial_number  likewise
+#   status         a known status in other case or with spaces is corrected;
+#                  any other status is removed
+#   timestamp      a date/time in another common layout is rewritten as
+#                  TIMESTAMP_FORMAT; anything else is removed
+#   duplicate      a key seen again: the last copy, the one the tracker
+#                  shows and updates, is kept and earlier copies removed
+#   header         a missing or wrong header row is replaced
+#
+# Removed rows are never thrown away: they go to a rejects file next to the
+# repaired log, exactly as they were read.
+
+CHECK_CHUNKS_PER_WORKER = 4
+
+# Timestamp layouts a hand-edited or spreadsheet-saved log is likely to hold
+TIMESTAMP_ALTERNATIVES = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M",
+                          "%d.%m.%Y %H:%M:%S", "%Y-%m-%d"]
+
+# TIMESTAMP_FORMAT as a pattern; much faster than strptime on every row
+TIMESTAMP_PATTERN = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2}) ([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]')
+
+
+class CheckReport:
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.problems = []  # (line number, kind, detail, fixed), in file order
+        self.kept = 0
+        self.removed = 0
+        self.output = None
+        self.rejects = None
+
+    def counts(self):
+        counts = {}
+        for _, kind, _, _ in self.problems:
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    def summary(self, limit=10):
+        if not self.problems:
+            return f"{self.path}: {self.rows} rows checked, no problems found."
+        lines = [f"{self.path}: {self.rows} rows checked, {len(self.problems)} problems found:"]
+        lines += [f"  {kind}: {count}" for kind, count in sorted(self.counts().items())]
+        lines += [f"  line {line}: {detail}" + (" (fixed)" if fixed else "")
+                  for line, _, detail, fixed in self.problems[:limit]]
+        if len(self.problems) > limit:
+            lines.append(f"  ... and {len(self.problems) - limit} more")
+        if self.output:
+            lines.append(f"Repaired log written to {self.output}: {self.kept} rows kept, {self.removed} removed.")
+            if self.removed:
+                lines.append(f"Removed rows were saved to {self.rejects}.")
+        return "\n".join(lines)
+
+    # Write every problem as a CSV row: line, problem, detail, action
+    def write(self, path):
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Line', 'Problem', 'Detail', 'Action'])
+            for line, kind, detail, fixed in self.problems:
+                writer.writerow([line, kind, detail, 'fixed' if fixed else 'removed'])
+
+
+def is_timestamp(text):
+    match = TIMESTAMP_PATTERN.fullmatch(text)
+    if match is None:
+        return False
+    try:
+        datetime(int(match[1]), int(match[2]), int(match[3]))  # Rejects 2024-02-30
+    except ValueError:
+        return False
+    return True
+
+
+def parse_timestamp(text):
+    for fmt in TIMESTAMP_ALTERNATIVES:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def is_blank(row):
+    return not row or (len(row) == 1 and not row[0].strip())
+
+
+# Function to check one log row. Returns the row as a repair would write it
+# (None if it has to be removed) and the problems found as (kind, detail).
+def check_row(row):
+    if is_blank(row):
+        return None, [('blank', "blank line")]
+    problems = []
+    if len(row) != 5:
+        if len(row) > 5 and not any(value.strip() for value in row[5:]):
+            problems.append(('columns', f"{len(row)} columns, the last {len(row) - 5} empty"))
+            row = row[:5]
+        else:
+            return None, [('columns', f"expected 5 columns, found {len(row)}")]
+    work_order, serial_number = make_key(row[0], row[1])
+    status, notes, timestamp = row[2], row[3], row[4]
+    if not (work_order and serial_number and status.strip()):
+        return None, problems + [('missing', "missing work order, serial number or status")]
+    if len(work_order) > WORK_ORDER_MAX_LENGTH:
+        return None, problems + [('work_order', f"work order {work_order!r} longer than {WORK_ORDER_MAX_LENGTH} characters")]
+    if len(serial_number) > SERIAL_NUMBER_MAX_LENGTH:
+        return None, problems + [('serial_number', f"serial number {serial_number!r} longer than "
+                                                   f"{SERIAL_NUMBER_MAX_LENGTH} characters")]
+    if status not in STATUSES:
+        known = STATUS_BY_NAME.get(status.strip().lower())
+        if known is None:
+            return None, problems + [('status', f"unknown status {status!r}")]
+        problems.append(('status', f"status {status!r} read as {known}"))
+        status = known
+    if not is_timestamp(timestamp):
+        when = parse_timestamp(timestamp.strip())
+        if when is None:
+            return None, problems + [('timestamp', f"timestamp {timestamp!r} is not a date and time")]
+        problems.append(('timestamp', f"timestamp {timestamp!r} rewritten as {when.strftime(TIMESTAMP_FORMAT)}"))
+        timestamp = when.strftime(TIMESTAMP_FORMAT)
+    return [work_order, serial_number, status, notes, timestamp], problems
+
+
+# Function to parse one chunk of the log: (line number within the chunk,
+# row) pairs, plus the number of lines in the chunk. Line numbers count
+# physical lines, so a note spanning lines moves the rows after it down.
+def read_chunk(path, identity, start, end):
+    data = read_range(path, identity, start, end)
+    if data is None:
+        raise ValueError(f"{path} was rewritten while it was being checked; run the check again")
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), newline=''))
+    numbered = []
+    line = 0
+    for row in reader:
+        numbered.append((line, row))
+        line = reader.line_num
+    return numbered, line
+
+
+# Worker process side of the first pass: check every row of one chunk and
+# return (problems, key of each row or None if removed, line of each row
+# within the chunk, lines in the chunk)
+def check_chunk(path, identity, start, end):
+    numbered, lines = read_chunk(path, identity, start, end)
+    problems = []
+    keys = []
+    row_lines = array('L')
+    for line, row in numbered:
+        fixed, row_problems = check_row(row)
+        fixed_all = fixed is not None or is_blank(row)  # Dropping a blank line loses nothing
+        problems += [(line, kind, detail, fixed_all) for kind, detail in row_problems]
+        keys.append((fixed[0], fixed[1]) if fixed is not None else None)
+        row_lines.append(line)
+    return problems, keys, row_lines, lines
+
+
+# Worker process side of a repair: write the repaired rows of one chunk, and
+# the rows removed from it, to part files. drop lists rows (by position in
+# the chunk) removed as duplicates.
+def repair_chunk(path, identity, start, end, drop, output_part, rejects_part):
+    numbered, _ = read_chunk(path, identity, start, end)
+    kept = removed = 0
+    with open(output_part, mode='w', newline='') as output, open(rejects_part, mode='w', newline='') as rejects:
+        output_writer = csv.writer(output)
+        rejects_writer = csv.writer(rejects)
+        for index, (_, row) in enumerate(numbered):
+            fixed, _ = check_row(row)
+            if fixed is not None and index not in drop:
+                output_writer.writerow(fixed)
+                kept += 1
+            elif not is_blank(row):
+                rejects_writer.writerow(row)
+                removed += 1
+    return kept, removed
+
+
+# Function to run fn over the argument tuples in order, on a process pool
+# when there is more than one worker
+def run_chunks(fn, arguments, workers):
+    if workers < 2 or len(arguments) < 2:
+        return [fn(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, *zip(*arguments)))
+
+
+def read_header(path):
+    with open(path, mode='r', newline='') as file:
+        return next(csv.reader(file), None)
+
+
+# Function to check the CSV log at path on workers processes (default: one
+# per core) and return a CheckReport. The row index is saved next to the file
+# only if persist is set, which is meant for the tracker's own log.
+def check_log(path, workers=None, persist=False):
+    return plan_check(path, workers, persist)[0]
+
+
+# The check itself. Also returns what a repair needs: the chunks checked,
+# the identity of the file they came from (MappedLog.identity) and, per
+# chunk number, the rows to drop as duplicates.
+def plan_check(path, workers=None, persist=False):
+    workers = workers or os.cpu_count() or 1
+    report = CheckReport(path)
+    with span('check', workers=workers) as trace:
+        with MappedLog(path, persist=persist) as log:
+            identity = log.identity
+            size = log.size
+            chunks = log.chunks(workers * CHECK_CHUNKS_PER_WORKER)
+            header_end = log.offsets[0]
+        if not chunks and header_end and size > header_end:
+            chunks = [(0, header_end, size)]
+        if chunks:
+            # Take in a last row that has no line end
+            first_row, start, _ = chunks[-1]
+            chunks[-1] = (first_row, start, size)
+
+        header = read_header(path) if size else None
+        if header != LOG_HEADER:
+            report.problems.append((1, 'header', f"header row is {header!r}", True))
+
+        results = run_chunks(check_chunk, [(path, identity, start, end) for _, start, end in chunks], workers)
+
+        # Turn chunk line numbers into file line numbers, and map every key
+        # to the last row that has it (rows are numbered across the file)
+        last_row = {}
+        first_rows = []
+        first_lines = []
+        row = 0
+        first_line = 2
+        for problems, keys, _, lines in results:
+            report.problems += [(first_line + line, kind, detail, fixed) for line, kind, detail, fixed in problems]
+            last_row.update(zip(keys, range(row, row + len(keys))))
+            first_rows.append(row)
+            first_lines.append(first_line)
+            row += len(keys)
+            first_line += lines
+        last_row.pop(None, None)
+        report.rows = row
+
+        # Any key on more than one row is a duplicate; all but the last copy go
+        drops = {}
+        if len(last_row) < sum(len(keys) - keys.count(None) for _, keys, _, _ in results):
+            def line_of(row):
+                chunk = bisect.bisect_right(first_rows, row) - 1
+                return first_lines[chunk] + results[chunk][2][row - first_rows[chunk]]
+
+            for chunk, (_, keys, row_lines, _) in enumerate(results):
+                for index, key in enumerate(keys):
+                    if key is not None and last_row[key] != first_rows[chunk] + index:
+                        report.problems.append((first_lines[chunk] + row_lines[index], 'duplicate',
+                                                f"{key[0]} / {key[1]} is repeated on line {line_of(last_row[key])}",
+                                                False))
+                        drops.setdefault(chunk, set()).add(index)
+        report.problems.sort(key=lambda problem: problem[0])
+        trace.count(rows_scanned=report.rows, bytes_read=size, problems=len(report.problems))
+    return report, chunks, identity, drops
+
+
+# Function to check the log at path and write a repaired copy to output
+# (default: replace path, keeping the original as path + '.bak'). Rows that
+# were removed are written to rejects (default: a dated file next to the
+# output). When replacing the log, the CSV backend's file lock is held
+# throughout so no station writes in between; stations that have the log
+# open should press Refresh afterwards.
+def repair_log(path, output=None, rejects=None, workers=None):
+    in_place = output is None
+    with FileLock(path + '.lock') if in_place else contextlib.nullcontext():
+        report, chunks, identity, drops = plan_check(path, workers)
+        target = path if in_place else output
+        report.output = target
+        report.rejects = rejects or os.path.splitext(target)[0] + datetime.now().strftime('_rejected_%Y%m%d-%H%M%S.csv')
+        workers = workers or os.cpu_count() or 1
+        with span('repair', workers=workers) as trace, tempfile.TemporaryDirectory(
+                dir=os.path.dirname(os.path.abspath(target))) as workdir:
+            arguments = [(path, identity, start, end, drops.get(number, set()),
+                          os.path.join(workdir, f"{number}.csv"), os.path.join(workdir, f"{number}.rejected.csv"))
+                         for number, (_, start, end) in enumerate(chunks)]
+            for kept, removed in run_chunks(repair_chunk, arguments, workers):
+                report.kept += kept
+                report.removed += removed
+
+            tmp_path = os.path.join(workdir, 'repaired.csv')
+            join_parts(tmp_path, LOG_HEADER, [args[5] for args in arguments])
+            header = read_header(path) if os.path.getsize(path) else None
+            old_header = [header] if header and header != LOG_HEADER else []
+            if report.removed or old_header:
+                join_parts(report.rejects + '.tmp', LOG_HEADER, [args[6] for args in arguments], old_header)
+                os.replace(report.rejects + '.tmp', report.rejects)
+            if in_place:
+                shutil.copy2(path, path + '.bak')
+            os.replace(tmp_path, target)
+            if in_place:
+                count_rewrite(path)
+            trace.count(rows_written=report.kept, bytes_written=os.path.getsize(target))
+        logger.info("Repaired %s into %s: %d rows kept, %d removed", path, target, report.kept, report.removed)
+    return report
+
+
+# Function to write a CSV file made of a header row (plus any extra rows)
+# followed by the part files, copied as they are
+def join_parts(path, header, parts, extra_rows=()):
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(extra_rows)
+        file.flush()
+        for part in parts:
+            with open(part, mode='r', newline='') as part_file:
+                shutil.copyfileobj(part_file, file, 1 << 20)
+        file.flush()
+        os.fsync(file.fileno())
+
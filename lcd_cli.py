@@ -0,0 +1,242 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+
+from lcd_core import (LOG_FILE, add_entry, bulk_set_status, open_log, query_log, status_history, tail_log,
+                      update_status, write_rows)
+from lcd_archive import ARCHIVE_AFTER_DAYS, archive_closed, archive_dir_for, archived_rows
+from lcd_check import check_log, repair_log
+from lcd_export import export_log, make_filter, parse_time_bound
+from lcd_model import STATUSES, RecordStore, StatusCounters
+from lcd_storage import CsvStorage
+from lcd_trace import configure_logging
+
+# Command line for the tracker, for scripts, cron jobs and scanner stations.
+# It never imports tkinter, so it starts fast and needs no display.
+#
+#   python lcd_cli.py add 1234 5678 Ordered --notes "cracked bezel"
+#   python lcd_cli.py set-status 1234 5678 Replaced
+#   python lcd_cli.py bulk-set-status scans.csv --status Returned
+#   python lcd_cli.py query --status Pending --text bezel
+#   python lcd_cli.py query --since "2024-05-01 08:00:00" --include-archive
+#   python lcd_cli.py tail 20
+#   python lcd_cli.py --storage journal history 1234 5678
+#   python lcd_cli.py stats --older-than 7
+#   python lcd_cli.py export backup.csv
+#   python lcd_cli.py export vendor.csv.gz --status Returned --since 2024-05-01 --until 2024-05-08
+#   python lcd_cli.py archive --days 365
+#   python lcd_cli.py check --report problems.csv
+#   python lcd_cli.py check --repair lcd_log_repaired.csv
+
+
+# Function to read bulk status changes: one "work order,serial number[,status]"
+# row per line, with an optional header row. Rows without a status use default.
+def read_status_changes(file, default_status):
+    for row in csv.reader(file):
+        if not row or row[0].strip() == 'Work Order':
+            continue
+        if len(row) < 2:
+            raise ValueError(f"expected work order and serial number, found {row!r}")
+        status = row[2].strip() if len(row) > 2 and row[2].strip() else default_status
+        if not status:
+            raise ValueError(f"no status for {row[0]} / {row[1]}; add a column or pass --status")
+        yield row[0], row[1], status
+
+
+def command_add(storage, args):
+    row = add_entry(storage, args.work_order, args.serial_number, args.status, args.notes)
+    print(f"Added {row[0]} / {row[1]} as {row[2]}")
+
+
+def command_set_status(storage, args):
+    if update_status(storage, args.work_order, args.serial_number, args.status) is None:
+        print(f"No entry found for {args.work_order} / {args.serial_number}", file=sys.stderr)
+        return 1
+    print(f"{args.work_order} / {args.serial_number} set to {args.status}")
+
+
+def command_bulk_set_status(storage, args):
+    if args.file == '-':
+        changes = list(read_status_changes(sys.stdin, args.status))
+    else:
+        with open(args.file, mode='r', newline='') as file:
+            changes = list(read_status_changes(file, args.status))
+    timestamp, updated, missing = bulk_set_status(storage, changes)
+    print(f"{len(updated)} entries updated at {timestamp}")
+    for work_order, serial_number in missing:
+        print(f"No entry found for {work_order} / {serial_number}", file=sys.stderr)
+    return 1 if missing else 0
+
+
+# Archive directory for commands that read or write the archive
+def archive_dir(args):
+    return args.archive_dir or archive_dir_for(args.log)
+
+
+def command_query(storage, args):
+    rows = query_log(storage, args.status, args.text, parse_time_bound(args.since), parse_time_bound(args.until),
+                     archive_dir(args) if args.include_archive else None)
+    if args.count:
+        print(sum(1 for _ in rows))
+    else:
+        write_rows(sys.stdout, rows)
+
+
+def command_tail(storage, args):
+    write_rows(sys.stdout, tail_log(storage, args.count))
+
+
+def command_history(storage, args):
+    transitions = status_history(storage, args.work_order, args.serial_number)
+    if not transitions:
+        print(f"No history found for {args.work_order} / {args.serial_number}", file=sys.stderr)
+        return 1
+    for at, old_status, new_status in transitions:
+        print(f"{at}  {new_status}" if old_status is None else f"{at}  {old_status} -> {new_status}")
+
+
+def command_stats(storage, args):
+    store = RecordStore()
+    counters = StatusCounters()
+    store.subscribe(counters)
+    store.load(storage.rows())
+    print(f"Total Entries: {counters.total}")
+    for status in STATUSES:
+        line = f"{status}: {counters.counts[status]}"
+        if args.older_than is not None:
+            line += f" ({counters.older_than(status, args.older_than)} older than {args.older_than} days)"
+        print(line)
+
+
+def command_export(storage, args):
+    log_filter = make_filter(args.status, args.since, args.until, args.work_order_prefix)
+    if args.path == '-':
+        rows = storage.select(log_filter)
+        if args.include_archive:
+            rows = itertools.chain(rows, archived_rows(archive_dir(args), log_filter))
+        write_rows(sys.stdout, rows)
+    else:
+        print(export_log(storage, args.path, log_filter,
+                         archive_dir=archive_dir(args) if args.include_archive else None).summary())
+
+
+def command_archive(storage, args):
+    print(archive_closed(storage, archive_dir(args), args.days).summary())
+
+
+# check reads the CSV file itself, so it works on any log or import file;
+# only --in-place needs the log to be in use with the CSV backend
+def command_check(storage, args):
+    path = args.path or args.log
+    if args.in_place:
+        if not isinstance(storage, CsvStorage) or os.path.abspath(path) != os.path.abspath(storage.path):
+            raise ValueError("--in-place repairs the log of the csv backend; use --repair FILE for anything else")
+        report = repair_log(path, workers=args.workers)
+    elif args.repair:
+        report = repair_log(path, args.repair, workers=args.workers)
+    else:
+        own_log = isinstance(storage, CsvStorage) and os.path.abspath(path) == os.path.abspath(storage.path)
+        report = check_log(path, args.workers, persist=own_log)
+    print(report.summary())
+    if args.report:
+        report.write(args.report)
+        print(f"All problems written to {args.report}")
+    return 1 if report.problems and not report.output else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Work with the LCD tracking log without the GUI.")
+    parser.add_argument('--log', default=LOG_FILE, help="log file (default: %(default)s)")
+    parser.add_argument('--storage', choices=['csv', 'sqlite', 'journal'],
+                        help="storage backend (default: LCD_STORAGE or csv)")
+    parser.add_argument('--server', help="log server host:port (default: LCD_SERVER)")
+    parser.add_argument('--archive-dir', help="archive of closed entries (default: <log name>_archive)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('add', help="add a new entry")
+    command.add_argument('work_order')
+    command.add_argument('serial_number')
+    command.add_argument('status', choices=STATUSES)
+    command.add_argument('--notes', default='')
+    command.set_defaults(run=command_add)
+
+    command = commands.add_parser('set-status', help="change the status of one entry")
+    command.add_argument('work_order')
+    command.add_argument('serial_number')
+    command.add_argument('status', choices=STATUSES)
+    command.set_defaults(run=command_set_status)
+
+    command = commands.add_parser('bulk-set-status', help="change the status of many entries in one pass")
+    command.add_argument('file', help="CSV of work order,serial number[,status] rows, or - for stdin")
+    command.add_argument('--status', choices=STATUSES, help="status for rows that do not give one")
+    command.set_defaults(run=command_bulk_set_status)
+
+    command = commands.add_parser('query', help="print matching entries as CSV")
+    command.add_argument('--status', choices=STATUSES)
+    command.add_argument('--text', help="text to find in the work order, serial number or notes")
+    command.add_argument('--since', default='', help="only entries stamped on or after this date/time")
+    command.add_argument('--until', default='', help="only entries stamped before this date/time")
+    command.add_argument('--include-archive', action='store_true', help="also search archived entries")
+    command.add_argument('--count', action='store_true', help="print only the number of matches")
+    command.set_defaults(run=command_query)
+
+    command = commands.add_parser('tail', help="print the newest entries as CSV")
+    command.add_argument('count', type=int, nargs='?', default=20, help="number of entries (default: %(default)s)")
+    command.set_defaults(run=command_tail)
+
+    command = commands.add_parser('history', help="print the status changes of one entry (journal backend)")
+    command.add_argument('work_order')
+    command.add_argument('serial_number')
+    command.set_defaults(run=command_history)
+
+    command = commands.add_parser('stats', help="print the dashboard counts")
+    command.add_argument('--older-than', type=int, metavar='DAYS', help="also count entries unchanged for DAYS")
+    command.set_defaults(run=command_stats)
+
+    command = commands.add_parser('export', help="export the log, or part of it, to a file")
+    command.add_argument('path', help="file to write: .csv, .csv.gz, .csv.zst, .parquet or .arrow (- for CSV on stdout)")
+    command.add_argument('--status', choices=STATUSES, action='append', help="only this status (repeatable)")
+    command.add_argument('--since', default='', help="only entries stamped on or after this date/time")
+    command.add_argument('--until', default='', help="only entries stamped before this date/time")
+    command.add_argument('--work-order-prefix', default='', help="only work orders starting with this")
+    command.add_argument('--include-archive', action='store_true', help="also export archived entries")
+    command.set_defaults(run=command_export)
+
+    command = commands.add_parser('archive', help="move old Replaced/Returned entries to the archive")
+    command.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                         help="archive entries unchanged for this many days (default: %(default)s)")
+    command.set_defaults(run=command_archive)
+
+    command = commands.add_parser('check', help="check a CSV log for malformed rows and duplicates, and repair it")
+    command.add_argument('path', nargs='?', help="CSV file to check (default: the log)")
+    command.add_argument('--repair', metavar='FILE', help="write a repaired copy to FILE")
+    command.add_argument('--in-place', action='store_true',
+                         help="repair the log itself, keeping the original as <log>.bak "
+                              "(press Refresh in open GUIs afterwards)")
+    command.add_argument('--report', metavar='FILE', help="write every problem found to FILE as CSV")
+    command.add_argument('--workers', type=int, help="processes to check with (default: one per core)")
+    command.set_defaults(run=command_check)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging()
+    try:
+        storage = open_log(args.log, args.storage, args.server)
+    except OSError as e:
+        print(f"Could not open the log: {e}", file=sys.stderr)
+        return 1
+    try:
+        return args.run(storage, args) or 0
+    except (ValueError, OSError) as e:  # DuplicateEntryError is a ValueError
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import collections
+import csv
+import itertools
+import os
+
+from lcd_archive import archived_rows
+from lcd_model import STATUSES
+from lcd_storage import (LOG_HEADER, SERIAL_NUMBER_MAX_LENGTH, WORK_ORDER_MAX_LENGTH, LogFilter, make_key,
+                         make_timestamp, open_storage)
+from lcd_sync import RemoteStorage, parse_address
+
+# Tracker operations without any user interface, shared by the GUI and the
+# command line (lcd_cli.py) and usable from scripts. Nothing here imports
+# tkinter. Every function takes the storage backend returned by open_log().
+
+LOG_FILE = 'lcd_log.csv'
+
+
+# Function to open the log the same way the GUI does: a log server when
+# server (or LCD_SERVER) is set, else the backend named by backend (or
+# LCD_STORAGE, default csv) on the file at path
+def open_log(path=LOG_FILE, backend=None, server=None):
+    server = server or os.environ.get('LCD_SERVER')
+    if server:
+        storage = RemoteStorage(parse_address(server))
+        storage.initialize()
+        return storage
+    return open_storage(backend or os.environ.get('LCD_STORAGE', 'csv'), path)
+
+
+# Function to check a new entry; returns the reason it is rejected or None.
+# Applies the same limits as the Add New Entry form.
+def validate_entry(work_order, serial_number, status):
+    work_order, serial_number = make_key(work_order, serial_number)
+    if not (work_order and serial_number and status):
+        return "work order, serial number and status are required"
+    if len(work_order) > WORK_ORDER_MAX_LENGTH:
+        return f"work order must be {WORK_ORDER_MAX_LENGTH} characters or less"
+    if len(serial_number) > SERIAL_NUMBER_MAX_LENGTH:
+        return f"serial number must be {SERIAL_NUMBER_MAX_LENGTH} characters or less"
+    if status not in STATUSES:
+        return f"status must be one of {', '.join(STATUSES)}"
+    return None
+
+
+# Function to add a new entry to the log; returns the stored row. Raises
+# ValueError for an invalid entry and DuplicateEntryError if it already
+# exists, which every backend checks while holding its write lock.
+def add_entry(storage, work_order, serial_number, status, notes=''):
+    reason = validate_entry(work_order, serial_number, status)
+    if reason:
+        raise ValueError(reason)
+    work_order, serial_number = make_key(work_order, serial_number)
+    timestamp = make_timestamp()
+    storage.add(work_order, serial_number, status, notes, timestamp)
+    return [work_order, serial_number, status, notes, timestamp]
+
+
+# Function to update the status of an entry in the log; returns the new
+# timestamp, or None if no entry matched
+def update_status(storage, work_order, serial_number, new_status):
+    if new_status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+    timestamp = make_timestamp()
+    if storage.update_status(work_order, serial_number, new_status, timestamp):
+        return timestamp
+    return None
+
+
+# Function to delete an entry; returns False if no entry matched
+def delete_entry(storage, work_order, serial_number):
+    return storage.delete(work_order, serial_number)
+
+
+# Function to apply many status changes, given as (work order, serial number,
+# status) triples, in one pass over the log with a single timestamp. A key
+# listed more than once takes its last status. Returns (timestamp, updated
+# keys, missing keys).
+def bulk_set_status(storage, changes):
+    by_key = {}
+    for work_order, serial_number, status in changes:
+        if status not in STATUSES:
+            raise ValueError(f"status must be one of {', '.join(STATUSES)}, not {status!r}")
+        by_key[make_key(work_order, serial_number)] = status
+    timestamp = make_timestamp()
+    updated = storage.update_status_many(by_key, timestamp) if by_key else set()
+    missing = [key for key in by_key if key not in updated]
+    return timestamp, updated, missing
+
+
+# Function to query the log by status, time range (since inclusive, until
+# exclusive; dates or timestamps) and/or text. Status and time are filtered
+# by the storage backend; text matches, ignoring case, anywhere in the work
+# order, serial number or notes. With archive_dir, archived entries are
+# searched too, after the live ones.
+def query_log(storage, status=None, text=None, since=None, until=None, archive_dir=None):
+    log_filter = LogFilter([status] if status else None, since, until)
+    rows = storage.select(log_filter)
+    if archive_dir:
+        rows = itertools.chain(rows, archived_rows(archive_dir, log_filter))
+    text = text.strip().lower() if text else None
+    for row in rows:
+        if text and not (text in row[0].lower() or text in row[1].lower() or text in row[3].lower()):
+            continue
+        yield row
+
+
+# Function to get the newest count entries, in the order they were added.
+# The CSV backend reads them straight from the end of the file through its
+# row index; other backends are read through.
+def tail_log(storage, count):
+    if hasattr(storage, 'tail'):
+        return storage.tail(count)
+    return list(collections.deque(storage.rows(), maxlen=count))
+
+
+# Function to get the status transitions of one entry, oldest first, as
+# (time, old status, new status); old status is None for the add. Only the
+# journal backend keeps them.
+def status_history(storage, work_order, serial_number):
+    if not hasattr(storage, 'history'):
+        raise ValueError("status history is only kept by the journal backend (--storage journal)")
+    return storage.history(work_order, serial_number)
+
+
+# Function to write the log, or any rows, as CSV to an open file
+def write_rows(file, rows):
+    writer = csv.writer(file)
+    writer.writerow(LOG_HEADER)
+    writer.writerows(rows)
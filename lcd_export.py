@@ -0,0 +1,180 @@
+import csv
+import gzip
+import io
+import itertools
+import os
+from contextlib import ExitStack
+from datetime import datetime
+
+from lcd_archive import archived_rows
+from lcd_storage import LOG_HEADER, TIMESTAMP_FORMAT, LogFilter
+from lcd_trace import span
+
+EXPORT_BATCH_SIZE = 50000
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Export formats by file name ending: (format, compression)
+EXPORT_FORMATS = {
+    '.csv.gz': ('csv', 'gzip'),
+    '.csv.zst': ('csv', 'zstd'),
+    '.parquet': ('parquet', None),
+    '.arrow': ('arrow', None),
+    '.feather': ('arrow', None),
+    '.csv': ('csv', None),
+}
+
+
+class ExportReport:
+    def __init__(self, path):
+        self.path = path
+        self.exported = 0
+        self.cancelled = False
+
+    def summary(self):
+        if self.cancelled:
+            return f"The export was cancelled after {self.exported} entries; {self.path} was not written."
+        return f"{self.exported} entries exported to {self.path}."
+
+
+# Function to pick the export format from the file name (plain CSV if unknown)
+def export_format(path):
+    lowered = path.lower()
+    for ending, export_type in EXPORT_FORMATS.items():
+        if lowered.endswith(ending):
+            return export_type
+    return 'csv', None
+
+
+# Function to read a date ("2024-05-01") or full timestamp typed by the user
+# as a LogFilter bound; raises ValueError if it is neither
+def parse_time_bound(text):
+    text = text.strip()
+    if not text:
+        return None
+    for fmt in (TIMESTAMP_FORMAT, "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).strftime(fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"{text!r} is not a date (YYYY-MM-DD) or timestamp (YYYY-MM-DD HH:MM:SS)")
+
+
+# Function to split rows into lists of at most size rows
+def batched(rows, size=EXPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Function to open a text stream for CSV output through a large write buffer
+# and, optionally, a gzip or zstd compressor. Everything opened is closed by stack.
+def open_csv_output(stack, path, compression):
+    raw = stack.enter_context(open(path, mode='wb', buffering=WRITE_BUFFER_SIZE))
+    if compression == 'gzip':
+        binary = stack.enter_context(gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6))
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd export needs the zstandard package (pip install zstandard)")
+        binary = stack.enter_context(zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False))
+    else:
+        binary = raw
+    if binary is not raw:
+        binary = io.BufferedWriter(binary, WRITE_BUFFER_SIZE)
+    return stack.enter_context(io.TextIOWrapper(binary, encoding='utf-8', newline=''))
+
+
+def write_csv(batches, path, compression, on_batch):
+    with ExitStack() as stack:
+        writer = csv.writer(open_csv_output(stack, path, compression))
+        writer.writerow(LOG_HEADER)
+        for batch in batches:
+            writer.writerows(batch)
+            if not on_batch(batch):
+                return
+
+
+# Parquet and Arrow IPC output. pyarrow is optional and only needed here.
+def write_columnar(batches, path, export_type, on_batch):
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet and Arrow export need the pyarrow package (pip install pyarrow)")
+
+    schema = pa.schema([
+        ('work_order', pa.string()),
+        ('serial_number', pa.string()),
+        ('status', pa.string()),
+        ('notes', pa.string()),
+        ('timestamp', pa.timestamp('s')),
+    ])
+    if export_type == 'parquet':
+        writer = pq.ParquetWriter(path, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for batch in batches:
+            columns = [pa.array(column, pa.string()) for column in zip(*batch)]
+            columns[4] = pc.strptime(columns[4], format=TIMESTAMP_FORMAT, unit='s', error_is_null=True)
+            table = pa.Table.from_arrays(columns, schema=schema)
+            if export_type == 'parquet':
+                writer.write_table(table)
+            else:
+                writer.write(table)
+            if not on_batch(batch):
+                return
+
+
+# Function to export the log, or the rows matching log_filter, to path in
+# the format its name asks for (.csv, .csv.gz, .csv.zst, .parquet, .arrow).
+# The filter is applied by the storage backend and rows are streamed in
+# batches, so the log is never held in memory. Runs on a worker thread:
+# on_progress(exported) is called after each batch and cancelled() checked.
+# The file is written under a temporary name and only replaces path once complete.
+# With archive_dir, matching archived entries are exported after the live ones.
+def export_log(storage, path, log_filter=None, on_progress=None, cancelled=lambda: False, archive_dir=None):
+    export_type, compression = export_format(path)
+    rows = storage.select(log_filter) if log_filter is not None else storage.rows()
+    if archive_dir:
+        rows = itertools.chain(rows, archived_rows(archive_dir, log_filter))
+    report = ExportReport(path)
+    tmp_path = path + '.tmp'
+
+    def on_batch(batch):
+        report.exported += len(batch)
+        if on_progress:
+            on_progress(report.exported)
+        if cancelled():
+            report.cancelled = True
+            return False
+        return True
+
+    with span('export', format=export_type, compression=compression or '') as trace:
+        try:
+            if export_type == 'csv':
+                write_csv(batched(rows), tmp_path, compression, on_batch)
+            else:
+                write_columnar(batched(rows), tmp_path, export_type, on_batch)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if report.cancelled:
+            os.remove(tmp_path)
+        else:
+            trace.count(rows_written=report.exported, bytes_written=os.path.getsize(tmp_path))
+            os.replace(tmp_path, path)
+    return report
+
+
+# Function to build a LogFilter from user input; empty fields are ignored
+def make_filter(statuses=None, since='', until='', work_order_prefix=''):
+    return LogFilter(statuses, parse_time_bound(since or ''), parse_time_bound(until or ''), work_order_prefix)
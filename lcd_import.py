@@ -0,0 +1,125 @@
+import csv
+import os
+
+from lcd_model import STATUS_BY_NAME, STATUSES
+from lcd_storage import SERIAL_NUMBER_MAX_LENGTH, WORK_ORDER_MAX_LENGTH, DuplicateEntryError, make_key, make_timestamp
+from lcd_trace import span
+
+IMPORT_CHUNK_SIZE = 5000
+
+
+# Problems found while importing, kept so the whole file can be processed
+# and reported on at the end instead of stopping at the first bad row
+class ImportReport:
+    def __init__(self, path):
+        self.path = path
+        self.imported = 0
+        self.duplicates = []  # (line number, work order, serial number)
+        self.malformed = []  # (line number, reason)
+        self.cancelled = False
+
+    def summary(self, limit=10):
+        lines = [f"{self.imported} entries imported from {self.path}."]
+        if self.cancelled:
+            lines.append("The import was cancelled; entries imported before that were kept.")
+        if self.duplicates:
+            lines.append(f"{len(self.duplicates)} duplicate entries skipped:")
+            lines += [f"  line {line or '?'}: {work_order} / {serial_number}" for line, work_order, serial_number in self.duplicates[:limit]]
+        if self.malformed:
+            lines.append(f"{len(self.malformed)} malformed rows skipped:")
+            lines += [f"  line {line}: {reason}" for line, reason in self.malformed[:limit]]
+        return "\n".join(lines)
+
+
+# Function to check one imported row; returns the reason it is rejected or None.
+# Applies the same limits as the Add New Entry form. A known status in
+# another case or with spaces around it is accepted (see import_status).
+def validate_import_row(row):
+    if len(row) < 4:
+        return f"expected at least 4 columns, found {len(row)}"
+    work_order, serial_number = make_key(row[0], row[1])
+    if not (work_order and serial_number and row[2].strip()):
+        return "missing work order, serial number or status"
+    if len(work_order) > WORK_ORDER_MAX_LENGTH:
+        return f"work order longer than {WORK_ORDER_MAX_LENGTH} characters"
+    if len(serial_number) > SERIAL_NUMBER_MAX_LENGTH:
+        return f"serial number longer than {SERIAL_NUMBER_MAX_LENGTH} characters"
+    if import_status(row[2]) is None:
+        return f"unknown status {row[2]!r}; expected one of {', '.join(STATUSES)}"
+    return None
+
+
+# Function to read the status of an imported row as one of STATUSES, or None
+def import_status(status):
+    return STATUS_BY_NAME.get(status.strip().lower())
+
+
+# Function to stream an import file in chunks of (line number, row) pairs,
+# along with how far through the file each chunk ends as a 0..1 fraction
+def read_import_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    total = max(1, os.path.getsize(path))
+    consumed = 0
+
+    def lines(file):
+        nonlocal consumed
+        for line in file:
+            consumed += len(line)
+            yield line
+
+    with open(path, mode='r', newline='') as file:
+        reader = csv.reader(lines(file))
+        next(reader, None)  # Skip header row
+        chunk = []
+        for row in reader:
+            chunk.append((reader.line_num, row))
+            if len(chunk) >= chunk_size:
+                yield chunk, min(1.0, consumed / total)
+                chunk = []
+        if chunk:
+            yield chunk, 1.0
+
+
+# Function to import a CSV file into storage one chunk at a time. Runs on a
+# worker thread: existing_keys is a private copy of the keys already in the
+# log, each chunk goes to storage.add_many in one write, and on_chunk(rows,
+# progress) hands the written rows back so the caller can show them.
+# cancelled() is checked between chunks.
+def import_csv(path, storage, existing_keys, on_chunk, cancelled=lambda: False, chunk_size=IMPORT_CHUNK_SIZE):
+    report = ImportReport(path)
+    with span('import_csv') as trace:
+        trace.count(bytes_read=os.path.getsize(path))
+        for chunk, progress in read_import_chunks(path, chunk_size):
+            if cancelled():
+                report.cancelled = True
+                break
+            timestamp = make_timestamp()
+            rows = []
+            for line, row in chunk:
+                reason = validate_import_row(row)
+                if reason:
+                    report.malformed.append((line, reason))
+                    continue
+                key = make_key(row[0], row[1])
+                if key in existing_keys:
+                    report.duplicates.append((line,) + key)
+                    continue
+                existing_keys.add(key)
+                rows.append([key[0], key[1], import_status(row[2]), row[3], timestamp])
+            if rows:
+                try:
+                    storage.add_many(rows)
+                except DuplicateEntryError:
+                    # Someone added one of these keys since the import started;
+                    # fall back to row by row so only that entry is skipped
+                    written = []
+                    for row in rows:
+                        try:
+                            storage.add_many([row])
+                            written.append(row)
+                        except DuplicateEntryError:
+                            report.duplicates.append((None, row[0], row[1]))
+                    rows = written
+                report.imported += len(rows)
+            trace.count(rows_scanned=len(chunk), rows_written=len(rows))
+            on_chunk(rows, progress)
+    return report
@@ -0,0 +1,295 @@
+import csv
+import io
+import itertools
+import mmap
+import operator
+import os
+import struct
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from lcd_trace import logger, span
+
+# Memory-mapped reading of the CSV log through a row-offset index. The index
+# holds the byte offset where every row starts, so row k, the newest n rows or
+# any slice of rows can be parsed without reading what comes before; bytes
+# only become Python strings for the rows asked for.
+#
+# The index is kept next to the log (lcd_log.csv.idx) and reused by later
+# runs. If the log has only grown by appending since, just the new bytes are
+# scanned; if it was rewritten (every status change or delete replaces the
+# file, see rewrite_generation) or truncated, the index is rebuilt. The map is opened per operation
+# and never held between them, because Windows will not replace a file that
+# is mapped.
+
+INDEX_MAGIC = b'LCDIDX2\n'
+# inode, rewrite generation, modification time (ns), indexed size, row
+# count, CRC32 of the last CHECK_BYTES indexed bytes
+INDEX_HEADER = struct.Struct('<QQqQQI')
+CHECK_BYTES = 4096
+SCAN_CHUNK_BYTES = 4 << 20
+PARALLEL_MIN_ROWS = 200000
+
+
+def index_path_for(log_path):
+    return log_path + '.idx'
+
+
+def generation_path_for(log_path):
+    return log_path + '.gen'
+
+
+# Rewriting the log (a status change, edit or delete, a repair, a journal
+# snapshot) replaces the file, and the new file can get back an inode the log
+# had before. Every rewrite is counted in a small file next to the log
+# (lcd_log.csv.gen), so anything kept about the file's contents can tell
+# that it is no longer the file it was read from even when the inode, size
+# and last bytes all match.
+def rewrite_generation(log_path):
+    try:
+        with open(generation_path_for(log_path), mode='r') as file:
+            return int(file.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+# Function to count a rewrite of the log. Called by the writer after the new
+# file is in place, holding the log's file lock; readers take the count
+# before opening the file, so they never pair the new count with the old file.
+def count_rewrite(log_path):
+    path = generation_path_for(log_path)
+    with open(path + '.tmp', mode='w') as file:
+        file.write(str(rewrite_generation(log_path) + 1))
+    os.replace(path + '.tmp', path)
+
+
+# Function to find where the rows in data[start:end] end, start being the
+# beginning of a row. A newline ends a row unless it is inside a quoted field;
+# quotes inside a field are written doubled, so an odd count of quotes since
+# the row began means the newline belongs to the field. Returns the offset
+# just past each row's newline; a last row with no newline yet is left out.
+def scan_row_ends(data, start, end):
+    offsets = array('Q')
+    quotes = 0  # quotes seen since the current row began
+    position = start
+    while position < end:
+        chunk_end = min(end, position + SCAN_CHUNK_BYTES)
+        chunk = data[position:chunk_end]
+        lines = chunk.split(b'\n')
+        if not quotes and b'"' not in chunk:
+            # Every newline ends a row: offsets are running sums of line lengths
+            ends = itertools.accumulate(map(len, lines[:-1]))
+            offsets.extend(map(operator.add, ends, itertools.count(position + 1)))
+        else:
+            line_end = position
+            for line in lines[:-1]:
+                line_end += len(line) + 1
+                quotes += line.count(b'"')
+                if not quotes % 2:
+                    offsets.append(line_end)
+                    quotes = 0
+            quotes += lines[-1].count(b'"')  # Row continues in the next chunk
+        position = chunk_end
+    return offsets
+
+
+# Function to parse rows out of bytes holding complete CSV rows. They are
+# decoded the way open() would decode the file.
+def parse_rows(data):
+    return list(csv.reader(io.TextIOWrapper(io.BytesIO(data), newline='')))
+
+
+# A CSV log file mapped read-only, with its row-offset index:
+#
+#   with MappedLog('lcd_log.csv') as log:
+#       newest = log.tail(20)
+#       row = log.row(12345)
+#
+# With persist=False the index is only kept in memory, for files other than
+# the tracker's own log (an import file, say) that should get no sidecar.
+class MappedLog:
+    def __init__(self, path, index_path=None, persist=True):
+        self.path = path
+        self.index_path = index_path or index_path_for(path)
+        self.persist = persist
+        self.file = None
+        self.data = None
+        self.size = 0
+        self.state = None  # (inode, rewrite generation, modification time) of the open file
+        self.identity = None  # (inode, rewrite generation), checked by worker processes
+        self.offsets = array('Q')  # start of every complete row, then the end of the last one
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        generation = rewrite_generation(self.path)  # Before opening: see count_rewrite
+        self.file = open(self.path, mode='rb')
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.identity = (stat.st_ino, generation)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        with span('mmap.index') as trace:
+            self._load_index((stat.st_ino, generation, stat.st_mtime_ns), trace)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    # Number of complete rows, not counting the header
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        self._check_starts([index])
+        return parse_rows(self.data[self.offsets[index]:self.offsets[index + 1]])[0]
+
+    # Rows start to stop (Python slice rules), parsed in one pass. A row still
+    # being appended by another station (no line end yet) is left out.
+    def rows(self, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return []
+        self._check_starts([start, stop])
+        return parse_rows(self.data[self.offsets[start]:self.offsets[stop]])
+
+    def tail(self, count):
+        return self.rows(max(0, len(self) - count))
+
+    # The rows split into about parts equal pieces, as (first row, start
+    # byte, end byte) for each piece
+    def chunks(self, parts):
+        count = len(self)
+        bounds = sorted({count * part // parts for part in range(parts + 1)})
+        self._check_starts(bounds)
+        return [(first, self.offsets[first], self.offsets[last]) for first, last in zip(bounds, bounds[1:])]
+
+    # Every row must start right after a line end. If one of the rows about
+    # to be used does not, the index no longer fits the file (edited in
+    # place by hand, say) and is built again from scratch.
+    def _check_starts(self, rows):
+        offsets = self.offsets
+        if all(self.data[offsets[row] - 1:offsets[row]] == b'\n' for row in rows if offsets[row]):
+            return
+        logger.warning("Row index %s does not match %s; rebuilding it", self.index_path, self.path)
+        with span('mmap.index') as trace:
+            self._load_index(self.state, trace, reuse=False)
+
+    # Use the saved index if it still describes the start of this file and
+    # scan only what was appended; otherwise scan the whole file
+    def _load_index(self, state, trace, reuse=True):
+        self.state = state
+        header_end = self.data.find(b'\n') + 1 if self.size else 0
+        offsets = self._read_index(state) if reuse and self.persist else None
+        if offsets is None:
+            offsets = array('Q', [header_end])
+        indexed = offsets[-1]
+        if indexed < self.size:
+            new_offsets = scan_row_ends(self.data, indexed, self.size)
+            offsets.extend(new_offsets)
+            trace.count(bytes_read=self.size - indexed, rows_indexed=len(new_offsets))
+            if self.persist and (offsets[-1] != indexed or not reuse):
+                self._write_index(state, offsets)
+        self.offsets = offsets
+
+    # The saved offsets, if they were made from this file before anything but
+    # appends: the same inode and rewrite generation, the same bytes at the
+    # end of what they cover, and not modified since if it has not grown
+    def _read_index(self, state):
+        inode, generation, mtime = state
+        try:
+            with open(self.index_path, mode='rb') as file:
+                if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                saved_inode, saved_generation, saved_mtime, indexed, count, check = INDEX_HEADER.unpack(
+                    file.read(INDEX_HEADER.size))
+                if (saved_inode, saved_generation) != (inode, generation) or indexed > self.size:
+                    return None
+                if (indexed == self.size and saved_mtime != mtime) or check != self._check(indexed):
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(file.read())
+        except (OSError, struct.error, ValueError):
+            return None
+        if len(offsets) != count + 1 or offsets[-1] != indexed:
+            return None
+        return offsets
+
+    # Saving is best effort: a read-only share just means scanning next time
+    def _write_index(self, state, offsets):
+        indexed = offsets[-1]
+        tmp_path = self.index_path + '.tmp'
+        try:
+            with open(tmp_path, mode='wb') as file:
+                file.write(INDEX_MAGIC)
+                file.write(INDEX_HEADER.pack(*state, indexed, len(offsets) - 1, self._check(indexed)))
+                offsets.tofile(file)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.info("Could not save the row index %s: %s", self.index_path, e)
+
+    def _check(self, indexed):
+        return zlib.crc32(self.data[max(0, indexed - CHECK_BYTES):indexed])
+
+
+# Function for a worker process handed a byte range of the log by
+# MappedLog.chunks(): read bytes start to end, or return None if the log is
+# no longer the file that was indexed (identity is MappedLog.identity), or
+# start no longer falls just after a line end
+def read_range(path, identity, start, end):
+    with open(path, mode='rb') as file:
+        if (os.fstat(file.fileno()).st_ino, rewrite_generation(path)) != identity:
+            return None
+        file.seek(max(0, start - 1))
+        data = file.read(end - file.tell())
+    if start:
+        if data[:1] != b'\n':
+            return None
+        data = data[1:]
+    return data
+
+
+# Worker process side of parallel_select: parse one byte range of the log
+# and return the rows log_filter keeps, or None if the log changed since it
+# was indexed
+def select_chunk(path, identity, start, end, log_filter):
+    data = read_range(path, identity, start, end)
+    if data is None:
+        return None
+    return [row for row in parse_rows(data) if len(row) == 5 and log_filter.matches(row)]
+
+
+# Function to filter a large log on several processes. The row index splits
+# the file into byte ranges that each process reads and parses by itself, so
+# only the matching rows are sent back. Returns None when that is not worth
+# it (a small log, one core, or no filter, when every row would be sent back)
+# or when the log was rewritten meanwhile; the caller then reads it as usual.
+def parallel_select(path, log_filter, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or not (log_filter.statuses or log_filter.since or log_filter.until or log_filter.work_order_prefix):
+        return None
+    with MappedLog(path) as log:
+        if len(log) < PARALLEL_MIN_ROWS:
+            return None
+        identity = log.identity
+        chunks = log.chunks(workers * 4)
+    with span('mmap.parallel_select', workers=workers) as trace, ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(select_chunk, *zip(*[(path, identity, start, end, log_filter) for _, start, end in chunks])))
+        if any(result is None for result in results):
+            return None
+        rows = [row for result in results for row in result]
+        trace.count(bytes_read=chunks[-1][2] - chunks[0][1], rows_matched=len(rows))
+    return rows
@@ -0,0 +1,507 @@
+import bisect
+import heapq
+import itertools
+import re
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from lcd_storage import TIMESTAMP_FORMAT, DuplicateEntryError, make_key
+
+STATUSES = ["Ordered", "Pending", "Replaced", "Returned"]
+
+# Statuses by lowercase name, for reading one typed in another case
+STATUS_BY_NAME = {status.lower(): status for status in STATUSES}
+
+# Status names by the small int stored in a Record. A status that is not one
+# of STATUSES (e.g. typed into an old or hand-edited log) gets the next code.
+STATUS_NAMES = list(STATUSES)
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_NAMES)}
+status_codes_lock = threading.Lock()  # Records are also made on worker threads
+
+
+def status_code(status):
+    code = STATUS_CODES.get(status)
+    if code is None:
+        with status_codes_lock:
+            code = STATUS_CODES.get(status)
+            if code is None:
+                code = len(STATUS_NAMES)
+                STATUS_NAMES.append(status)
+                STATUS_CODES[status] = code
+    return code
+
+
+# One log entry as kept in memory by RecordStore. A list per row costs a
+# list object, its item array and a separate copy of the status string; a
+# Record has fixed slots, stores the status as a small int and shares work
+# order strings between the entries of a work order (sys.intern), which
+# saves about 70 bytes per entry and a seventh of the collector's time
+# (see benchmarks/bench_memory.py).
+#
+# A Record still reads like a row: record[2] is the status name, and it can
+# be unpacked, sliced or passed to list() and csv writers.
+class Record:
+    __slots__ = ('work_order', 'serial_number', 'code', 'notes', 'timestamp')
+
+    def __init__(self, work_order, serial_number, status, notes, timestamp):
+        self.work_order = sys.intern(work_order)
+        self.serial_number = serial_number
+        self.code = status_code(status)
+        self.notes = notes
+        self.timestamp = timestamp
+
+    @property
+    def status(self):
+        return STATUS_NAMES[self.code]
+
+    def values(self):
+        return (self.work_order, self.serial_number, STATUS_NAMES[self.code], self.notes, self.timestamp)
+
+    def __getitem__(self, index):
+        if index == 2:
+            return STATUS_NAMES[self.code]
+        if index == 4:
+            return self.timestamp
+        return self.values()[index]
+
+    def __len__(self):
+        return 5
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __eq__(self, other):
+        if not isinstance(other, (Record, list, tuple)):
+            return NotImplemented
+        return list(self.values()) == list(other)
+
+    __hash__ = None  # Compared by value, like the row lists they stand in for, so not hashable either
+
+    def __repr__(self):
+        return f"Record{self.values()!r}"
+
+
+# Function to make a Record stored under key from a row (list or Record)
+def make_record(key, row):
+    return Record(key[0], key[1], row[2], row[3], row[4])
+
+
+# Function to turn rows read from storage into RecordStore records. Rows
+# sharing a key collapse into the last one, the same record every update
+# would touch.
+def make_records(rows):
+    records = {}
+    for row in rows:
+        if len(row) == 5:
+            key = make_key(row[0], row[1])
+            records[key] = make_record(key, row)
+    return records
+
+
+# In-memory copy of the log with one record per (work order, serial number)
+# key. Every mutation is forwarded to the subscribed listeners, so views and
+# summaries can apply just that change instead of reloading the whole log.
+#
+# Listeners implement on_reset(store), on_insert(key, row),
+# on_update(old_key, key, old_row, row), on_delete(key, row) and
+# on_batch_end(); while store.batching is set, listeners may put off
+# expensive work until on_batch_end.
+#
+# A reset is split in two so the GUI can do the slow half on a worker
+# thread: build(records) makes the listener's state for a new set of
+# records without touching the listener, and adopt(store, state) switches
+# to it by swapping, leaving the replaced state in state. on_reset(store)
+# is the two in a row.
+class RecordStore:
+    def __init__(self):
+        self.records = {}
+        self.listeners = []
+        self.batching = False
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        listener.on_reset(self)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def rows(self):
+        return self.records.values()
+
+    # Replace the contents with rows read from storage
+    def load(self, rows):
+        self.finish_load(self.prepare_load(rows))
+
+    # The slow half of load(): make the records and every listener's state
+    # for them. Safe to run on a worker thread, as it leaves the store and
+    # its listeners as they are; finish_load() then swaps the result in.
+    def prepare_load(self, rows):
+        records = make_records(rows)
+        return [records, [listener.build(records) for listener in self.listeners]]
+
+    # Afterwards prepared holds the records and listener state that were
+    # replaced, so the caller can choose where the time to free them is spent
+    def finish_load(self, prepared):
+        self.records, prepared[0] = prepared[0], self.records
+        for listener, state in zip(self.listeners, prepared[1]):
+            listener.adopt(self, state)
+
+    def add(self, row):
+        key = make_key(row[0], row[1])
+        if key in self.records:
+            raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+        row = make_record(key, row)
+        self.records[key] = row
+        for listener in self.listeners:
+            listener.on_insert(key, row)
+        return key
+
+    # Add many rows as one batch. Rows whose key is already present are
+    # skipped and returned.
+    def add_many(self, rows):
+        skipped = []
+        self.batching = True
+        try:
+            for row in rows:
+                if make_key(row[0], row[1]) in self.records:
+                    skipped.append(row)
+                else:
+                    self.add(row)
+        finally:
+            self.batching = False
+            for listener in self.listeners:
+                listener.on_batch_end()
+        return skipped
+
+    # Replace the record stored under key with row; the row may carry a new key
+    def update(self, key, row):
+        old_row = self.records.get(key)
+        if old_row is None:
+            return False
+        new_key = make_key(row[0], row[1])
+        if new_key != key and new_key in self.records:
+            raise DuplicateEntryError(f"Work Order {new_key[0]} / Serial Number {new_key[1]} already exists")
+        row = make_record(new_key, row)
+        if new_key != key:
+            del self.records[key]
+        self.records[new_key] = row
+        for listener in self.listeners:
+            listener.on_update(key, new_key, old_row, row)
+        return True
+
+    def set_status(self, key, new_status, timestamp):
+        row = self.records.get(key)
+        if row is None:
+            return False
+        return self.update(key, [row[0], row[1], new_status, row[3], timestamp])
+
+    def remove(self, key):
+        row = self.records.pop(key, None)
+        if row is None:
+            return False
+        for listener in self.listeners:
+            listener.on_delete(key, row)
+        return True
+
+
+# Function to count entries per status in one pass over rows
+def count_statuses(rows):
+    counts = dict.fromkeys(STATUSES, 0)
+    total = 0
+    for row in rows:
+        total += 1
+        if row[2] in counts:
+            counts[row[2]] += 1
+    return total, counts
+
+
+# Dashboard counts kept up to date from RecordStore changes: +1/-1 on
+# insert/delete and a move between buckets on a status change. Per status the
+# timestamps are also kept sorted, so "how many have sat in this status for
+# more than N days" is a bisect instead of a scan.
+class StatusCounters:
+    def __init__(self):
+        self.total = 0
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.timestamps = {status: [] for status in STATUSES}
+
+    def on_reset(self, store):
+        self.adopt(store, self.build(store.records))
+
+    # A StatusCounters for records, whose counts adopt() takes over
+    def build(self, records):
+        counters = StatusCounters()
+        counters.total, counters.counts = count_statuses(records.values())
+        for row in records.values():
+            if row[2] in counters.timestamps:
+                counters.timestamps[row[2]].append(row[4])
+        for timestamps in counters.timestamps.values():
+            timestamps.sort()
+        return counters
+
+    def adopt(self, store, counters):
+        self.total, counters.total = counters.total, self.total
+        self.counts, counters.counts = counters.counts, self.counts
+        self.timestamps, counters.timestamps = counters.timestamps, self.timestamps
+
+    def on_insert(self, key, row):
+        self.total += 1
+        self._add(row)
+
+    def on_update(self, old_key, key, old_row, row):
+        if old_row[2] != row[2] or old_row[4] != row[4]:
+            self._remove(old_row)
+            self._add(row)
+
+    def on_delete(self, key, row):
+        self.total -= 1
+        self._remove(row)
+
+    def on_batch_end(self):
+        pass
+
+    # Entries whose status has not changed for more than days
+    def older_than(self, status, days, now=None):
+        cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+        return bisect.bisect_left(self.timestamps.get(status, []), cutoff)
+
+    # Recount rows from scratch and return the buckets that disagree with the
+    # running counts as {name: (running, recounted)}
+    def verify(self, rows):
+        return self.compare(*count_statuses(rows))
+
+    # Same as verify() for a recount made elsewhere, e.g. on a worker thread
+    def compare(self, total, counts):
+        mismatches = {}
+        if total != self.total:
+            mismatches['Total Entries'] = (self.total, total)
+        for status in STATUSES:
+            if counts[status] != self.counts[status]:
+                mismatches[status] = (self.counts[status], counts[status])
+        return mismatches
+
+    def _add(self, row):
+        if row[2] in self.counts:
+            self.counts[row[2]] += 1
+            bisect.insort(self.timestamps[row[2]], row[4])
+
+    def _remove(self, row):
+        if row[2] in self.counts:
+            self.counts[row[2]] -= 1
+            timestamps = self.timestamps[row[2]]
+            del timestamps[bisect.bisect_left(timestamps, row[4])]
+
+
+# Records ordered by timestamp, kept up to date from RecordStore changes, so
+# date-range lookups are a bisect instead of a scan. Used by the log server
+# and the journal backend.
+# Rows added in a batch are sorted in once at the end of the batch.
+class TimeIndex:
+    def __init__(self):
+        self.store = None
+        self.entries = []  # (timestamp, key), sorted
+        self.unsorted = False
+
+    def on_reset(self, store):
+        self.adopt(store, self.build(store.records))
+
+    def build(self, records):
+        index = TimeIndex()
+        index.entries = sorted((row[4], key) for key, row in records.items())
+        return index
+
+    def adopt(self, store, index):
+        self.store = store
+        self.entries, index.entries = index.entries, self.entries
+        self.unsorted = False
+
+    def on_insert(self, key, row):
+        if self.store is not None and self.store.batching:
+            self.entries.append((row[4], key))
+            self.unsorted = True
+        else:
+            bisect.insort(self.entries, (row[4], key))
+
+    def on_update(self, old_key, key, old_row, row):
+        if old_key != key or old_row[4] != row[4]:
+            self.on_delete(old_key, old_row)
+            self.on_insert(key, row)
+
+    def on_delete(self, key, row):
+        self.on_batch_end()
+        del self.entries[bisect.bisect_left(self.entries, (row[4], key))]
+
+    def on_batch_end(self):
+        if self.unsorted:
+            self.entries.sort()
+            self.unsorted = False
+
+    # Keys of records stamped at or after since and before until, oldest
+    # first. Either bound may be None, or just a date.
+    def between(self, since=None, until=None):
+        self.on_batch_end()
+        start = bisect.bisect_left(self.entries, (since,)) if since else 0
+        end = bisect.bisect_left(self.entries, (until,)) if until else len(self.entries)
+        return [key for _, key in self.entries[start:end]]
+
+
+# Columns whose values sort with digit runs compared as numbers
+NUMBER_COLUMNS = (0, 1)  # Work Order, Serial Number
+DIGIT_RUNS = re.compile(r'([0-9]+)')
+
+
+# Function to make the sort value of a work order or serial number, so that
+# 2 sorts before 10 and WO-9 before WO-10. The text is split into runs that
+# alternate text, number, text, ... so like parts are always compared.
+def natural_value(text):
+    if text.isascii() and text.isdigit():
+        return ('', int(text), '')
+    parts = DIGIT_RUNS.split(text)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+# Function to make the SortOrders entry of a record for column: (value, key),
+# with the insertion sequence number as the value for column None
+def order_entry(seq, column, key, row):
+    if column is None:
+        return (seq[key], key)
+    if column in NUMBER_COLUMNS:
+        return (natural_value(row[column]), key)
+    return (row[column], key)
+
+
+# Function to build the SortOrders lists of records for column: one sort of
+# every entry, then a split by status, which keeps each part in order
+def build_order(records, seq, column):
+    entries = sorted(order_entry(seq, column, key, row) for key, row in records.items())
+    parts = {}
+    for entry in entries:
+        status = records[entry[1]][2]
+        part = parts.get(status)
+        if part is None:
+            part = parts[status] = []
+        part.append(entry)
+    return entries, parts
+
+
+# Records in order of any column, kept both as one list and split by status,
+# so a view can switch sort column, direction or the statuses it shows
+# without sorting or re-reading anything. Each list holds (value, key)
+# entries in order, the split lists sharing the entry tuples of the full
+# one; column None orders records by when they were added. A column's lists
+# are built the first time it is asked for and from then on kept up to date
+# from RecordStore changes, one insort or delete per list.
+class SortOrders:
+    def __init__(self):
+        self.store = None
+        self.seq = {}  # key -> insertion sequence number
+        self.next_seq = 0
+        self.orders = {None: ([], {})}  # column -> (all entries, {status: entries})
+
+    def entry(self, column, key, row):
+        return order_entry(self.seq, column, key, row)
+
+    # The sorted lists that together hold column's order for the records in
+    # statuses (every status if None)
+    def lists(self, column, statuses=None):
+        order = self.orders.get(column)
+        if order is None:
+            order = self.orders[column] = build_order(self.store.records, self.seq, column)
+        if statuses is None:
+            return [order[0]]
+        return [entries for status, entries in order[1].items() if status in statuses]
+
+    def on_reset(self, store):
+        self.adopt(store, self.build(store.records))
+
+    # A SortOrders for records with the columns this one has built so far
+    def build(self, records):
+        orders = SortOrders()
+        orders.seq = {key: index for index, key in enumerate(records)}
+        orders.next_seq = len(orders.seq)
+        for column in list(self.orders):
+            orders.orders[column] = build_order(records, orders.seq, column)
+        return orders
+
+    def adopt(self, store, orders):
+        self.store = store
+        self.seq, orders.seq = orders.seq, self.seq
+        self.next_seq, orders.next_seq = orders.next_seq, self.next_seq
+        self.orders, orders.orders = orders.orders, self.orders
+
+    def on_insert(self, key, row):
+        self.seq[key] = self.next_seq
+        self.next_seq += 1
+        self._insert(key, row)
+
+    def on_update(self, old_key, key, old_row, row):
+        self._remove(old_key, old_row)
+        self.seq[key] = self.seq.pop(old_key)
+        self._insert(key, row)
+
+    def on_delete(self, key, row):
+        self._remove(key, row)
+        del self.seq[key]
+
+    def on_batch_end(self):
+        pass
+
+    def _insert(self, key, row):
+        for column, (entries, parts) in self.orders.items():
+            entry = self.entry(column, key, row)
+            bisect.insort(entries, entry)
+            bisect.insort(parts.setdefault(row[2], []), entry)
+
+    def _remove(self, key, row):
+        for column, (entries, parts) in self.orders.items():
+            entry = self.entry(column, key, row)
+            del entries[bisect.bisect_left(entries, entry)]
+            part = parts[row[2]]
+            del part[bisect.bisect_left(part, entry)]
+
+
+# Function to count the entries of lists that sort before entry
+def merged_rank(lists, entry):
+    return sum(map(bisect.bisect_left, lists, itertools.repeat(entry, len(lists))))
+
+
+# Function to find the entry at position index of several sorted lists taken
+# together, without merging them: a binary search in each list for the entry
+# with exactly index entries before it, counted with a bisect per list
+def merged_nth(lists, index):
+    lists = [entries for entries in lists if entries]
+    if len(lists) == 1:
+        return lists[0][index]
+    for entries in lists:
+        low, high = 0, len(entries)
+        while low < high:
+            middle = (low + high) // 2
+            rank = merged_rank(lists, entries[middle])
+            if rank < index:
+                low = middle + 1
+            elif rank > index:
+                high = middle
+            else:
+                return entries[middle]
+    raise IndexError(index)
+
+
+# Function to get count entries of several sorted lists taken together,
+# starting at position start
+def merged_slice(lists, start, count):
+    if count <= 0 or start >= sum(map(len, lists)):
+        return []
+    first = merged_nth(lists, start)
+    heads = []
+    for entries in lists:
+        begin = bisect.bisect_left(entries, first)
+        heads.append(entries[begin:begin + count])
+    return list(itertools.islice(heapq.merge(*heads), count))
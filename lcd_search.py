@@ -0,0 +1,148 @@
+import bisect
+import re
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+# Function to split notes or a query into lowercase words
+def split_words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+# Function to list the distinct three-character substrings of value
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+# Function to split a record key into what the id index holds for it: its
+# lowercased ids of one or two characters, and the trigrams of the others
+def id_parts(key):
+    shorts = set()
+    grams = set()
+    for value in key:
+        value = value.lower()
+        if len(value) < 3:
+            shorts.add(value)
+        else:
+            grams |= trigrams(value)
+    return shorts, grams
+
+
+# Function to remove key from the posting set index[name], dropping the set once empty
+def discard_posting(index, name, key):
+    keys = index[name]
+    keys.discard(key)
+    if not keys:
+        del index[name]
+
+
+# Search index over a RecordStore, updated on every change:
+# - a trigram index over work orders and serial numbers for substring
+#   lookups; a query of one or two characters is found through the trigrams
+#   that contain it, and ids too short to have trigrams are kept apart
+# - a word index over Notes, with a sorted vocabulary so each query word can
+#   match any note word it is a prefix of
+class SearchIndex:
+    def __init__(self):
+        self.short_ids = {}  # ids of one or two characters -> keys
+        self.grams = {}
+        self.words = {}
+        self.vocabulary = []
+
+    def on_reset(self, store):
+        self.adopt(store, self.build(store.records))
+
+    # A SearchIndex over records, whose postings adopt() takes over
+    def build(self, records):
+        index = SearchIndex()
+        for key, row in records.items():
+            index._add_ids(key)
+            for word in set(split_words(row[3])):
+                index.words.setdefault(word, set()).add(key)
+        index.vocabulary = sorted(index.words)
+        return index
+
+    def adopt(self, store, index):
+        self.short_ids, index.short_ids = index.short_ids, self.short_ids
+        self.grams, index.grams = index.grams, self.grams
+        self.words, index.words = index.words, self.words
+        self.vocabulary, index.vocabulary = index.vocabulary, self.vocabulary
+
+    def on_insert(self, key, row):
+        self._add_ids(key)
+        for word in set(split_words(row[3])):
+            if word not in self.words:
+                self.words[word] = set()
+                bisect.insort(self.vocabulary, word)
+            self.words[word].add(key)
+
+    def on_update(self, old_key, key, old_row, row):
+        if old_key != key or old_row[3] != row[3]:
+            self.on_delete(old_key, old_row)
+            self.on_insert(key, row)
+
+    def on_delete(self, key, row):
+        self._remove_ids(key)
+        for word in set(split_words(row[3])):
+            keys = self.words[word]
+            keys.discard(key)
+            if not keys:
+                del self.words[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+
+    def on_batch_end(self):
+        pass
+
+    # Keys of every record whose work order or serial number contains query,
+    # or whose notes contain a word starting with each word of query
+    def search(self, query):
+        query = query.strip().lower()
+        if not query:
+            return set()
+        return self.search_ids(query) | self.search_notes(query)
+
+    def search_ids(self, query):
+        if len(query) < 3:
+            # Too short to have trigrams, but every longer id containing it
+            # has a trigram that does; those match without a further check
+            matches = set().union(*(keys for gram, keys in self.grams.items() if query in gram))
+            for value, keys in self.short_ids.items():
+                if query in value:
+                    matches |= keys
+            return matches
+        candidates = None
+        for keys in sorted((self.grams.get(gram, ()) for gram in trigrams(query)), key=len):
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return set()
+        # Trigrams can match out of order, so confirm the substring itself
+        return {key for key in candidates if query in key[0].lower() or query in key[1].lower()}
+
+    def search_notes(self, query):
+        matches = None
+        for word in split_words(query):
+            start = bisect.bisect_left(self.vocabulary, word)
+            end = bisect.bisect_left(self.vocabulary, word + '\uffff')
+            keys = set()
+            for note_word in self.vocabulary[start:end]:
+                keys |= self.words[note_word]
+            matches = keys if matches is None else matches & keys
+            if not matches:
+                return set()
+        return matches or set()
+
+    # Index the work order and serial number of the record key. The two can
+    # share trigrams, so each key is added to or removed from a posting once.
+    def _add_ids(self, key):
+        shorts, grams = id_parts(key)
+        for value in shorts:
+            self.short_ids.setdefault(value, set()).add(key)
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(key)
+
+    def _remove_ids(self, key):
+        shorts, grams = id_parts(key)
+        for value in shorts:
+            discard_posting(self.short_ids, value, key)
+        for gram in grams:
+            discard_posting(self.grams, gram, key)
@@ -0,0 +1,894 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+from lcd_mmap import MappedLog, count_rewrite, parallel_select, rewrite_generation
+from lcd_trace import logger, span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Column layout shared by every storage backend
+LOG_HEADER = ['Work Order', 'Serial Number', 'Status', 'Notes', 'Timestamp']
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+WORK_ORDER_MAX_LENGTH = 10
+SERIAL_NUMBER_MAX_LENGTH = 8
+
+
+# Raised when an add or edit would create a second record with the same key
+class DuplicateEntryError(ValueError):
+    pass
+
+
+# Raised when a log that only one process may have open at a time (the
+# journal backend's) is already open elsewhere
+class LogInUseError(OSError):
+    pass
+
+
+# Function to build the timestamp stored with every add and status change
+def make_timestamp():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+# Function to build the (work order, serial number) key that identifies a record
+def make_key(work_order, serial_number):
+    return (str(work_order).strip(), str(serial_number).strip())
+
+
+# Conditions on log rows that a backend's select() applies while reading, so
+# only matching rows leave storage (as an indexed query for SQLite). since is
+# inclusive and until exclusive; timestamps compare as strings, which orders
+# correctly in TIMESTAMP_FORMAT, so either may also be just a date.
+class LogFilter:
+    def __init__(self, statuses=None, since=None, until=None, work_order_prefix=None):
+        self.statuses = sorted(set(statuses)) if statuses else None
+        self.since = since or None
+        self.until = until or None
+        self.work_order_prefix = work_order_prefix.strip() if work_order_prefix else None
+
+    def matches(self, row):
+        if self.statuses is not None and row[2] not in self.statuses:
+            return False
+        if self.since is not None and row[4] < self.since:
+            return False
+        if self.until is not None and row[4] >= self.until:
+            return False
+        if self.work_order_prefix is not None and not row[0].strip().startswith(self.work_order_prefix):
+            return False
+        return True
+
+    # The same conditions as an SQL WHERE clause and its parameters
+    def where(self):
+        clauses = []
+        params = []
+        if self.statuses is not None:
+            clauses.append(f"status IN ({', '.join('?' * len(self.statuses))})")
+            params += self.statuses
+        if self.since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append("timestamp < ?")
+            params.append(self.until)
+        if self.work_order_prefix is not None:
+            # A range rather than LIKE, so the (work_order, serial_number) index is used
+            clauses.append("work_order >= ? AND work_order < ?")
+            params += [self.work_order_prefix, self.work_order_prefix + '\uffff']
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+# Function to write a complete log (header plus rows) to path and flush it to disk
+def write_log_file(path, rows):
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(LOG_HEADER)
+        writer.writerows(rows)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Advisory lock on a file shared between processes (or workstations on a
+# network drive). Held around every read-modify-write of the CSV log so two
+# stations writing at once cannot lose each other's changes. With blocking
+# False, acquiring a lock another process holds raises BlockingIOError
+# instead of waiting.
+class FileLock:
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self):
+        self.file = open(self.path, mode='a+')
+        try:
+            if fcntl is not None:
+                fcntl.lockf(self.file, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if self.blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not self.blocking:
+                            raise
+                        # LK_LOCK gives up after 10 seconds; keep waiting
+        except OSError as e:
+            self.file.close()
+            self.file = None
+            if self.blocking:
+                raise
+            raise BlockingIOError(f"{self.path} is locked by another process") from e
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.lockf(self.file, fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+# Every backend is safe to call from several threads: mutations are
+# serialized on a per-backend lock.
+
+
+# Legacy backend: a flat CSV file that is rewritten on every change.
+#
+# Several stations may share the file, so duplicate keys are checked under
+# the file lock, against the file rather than a station's own view of it.
+# To keep adds from reading the whole log every time, the hashes of the keys
+# in the file are kept along with the file's identity, rewrite count (see
+# lcd_mmap.rewrite_generation) and size; as long as the file has only been
+# appended to since, just the new rows are read. A matching hash is confirmed
+# against the file before an add is refused.
+class CsvStorage:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(path + '.lock')
+        self.key_hashes = None
+        self.key_hashes_at = None  # _file_state() of the file they were read from
+
+    def initialize(self):
+        if not os.path.exists(self.path):
+            with open(self.path, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(LOG_HEADER)
+
+    def close(self):
+        pass
+
+    def rows(self):
+        with span('csv.rows') as trace, open(self.path, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header row
+            scanned = 0
+            for row in reader:
+                scanned += 1
+                yield row
+            trace.count(rows_scanned=scanned, bytes_read=os.fstat(file.fileno()).st_size)
+
+    # Rows matching log_filter, filtered as the file is read. A large log is
+    # filtered on several processes at once (see lcd_mmap).
+    def select(self, log_filter):
+        rows = parallel_select(self.path, log_filter)
+        if rows is not None:
+            yield from rows
+            return
+        for row in self.rows():
+            if len(row) == 5 and log_filter.matches(row):
+                yield row
+
+    # The newest count rows, read through the row index without parsing the rest
+    def tail(self, count):
+        with span('csv.tail') as trace, MappedLog(self.path) as log:
+            rows = log.tail(count)
+            trace.count(rows_scanned=len(rows))
+        return rows
+
+    def add(self, work_order, serial_number, status, notes, timestamp):
+        self.add_many([[work_order, serial_number, status, notes, timestamp]])
+
+    # Append complete rows through a single file handle. Raises
+    # DuplicateEntryError, writing nothing, if any key is already in the log.
+    def add_many(self, rows):
+        with self.lock, self.file_lock, span('csv.add_many') as trace:
+            hashes = self._key_hashes()
+            keys = set()
+            for row in rows:
+                key = make_key(row[0], row[1])
+                if key in keys or (hash(key) in hashes and self._has_key(key)):
+                    raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+                keys.add(key)
+            with open(self.path, mode='a', newline='') as file:
+                start = file.tell()
+                writer = csv.writer(file)
+                writer.writerows(rows)
+                trace.count(rows_written=len(rows), bytes_written=file.tell() - start)
+            hashes.update(map(hash, keys))
+            self.key_hashes_at = self._file_state()
+
+    def update_status(self, work_order, serial_number, new_status, timestamp):
+        def change(row):
+            row[2] = new_status
+            row[4] = timestamp
+            return row
+        return bool(self._rewrite({make_key(work_order, serial_number)}, change))
+
+    # Apply many status changes ({key: new status}) in a single rewrite of
+    # the file. Returns the set of keys that were found.
+    def update_status_many(self, changes, timestamp):
+        def change(row):
+            row[2] = changes[make_key(row[0], row[1])]
+            row[4] = timestamp
+            return row
+        return self._rewrite(changes, change)
+
+    def edit(self, work_order, serial_number, new_work_order, new_serial_number, new_status, new_notes):
+        def change(row):
+            # Keep the original timestamp
+            return [new_work_order, new_serial_number, new_status, new_notes, row[4]]
+        return bool(self._rewrite({make_key(work_order, serial_number)}, change,
+                                  taken={make_key(new_work_order, new_serial_number)}))
+
+    def delete(self, work_order, serial_number):
+        return bool(self._rewrite({make_key(work_order, serial_number)}, lambda row: None))
+
+    # Delete many entries in a single rewrite; returns the set of keys
+    # deleted. With expected ({key: row}), an entry is only deleted while its
+    # row is still exactly that one.
+    def delete_many(self, keys, expected=None):
+        if expected is None:
+            return self._rewrite(set(keys), lambda row: None)
+        deleted = set()
+
+        def change(row):
+            key = make_key(row[0], row[1])
+            if row != list(expected[key]):
+                return row
+            deleted.add(key)
+            return None
+        self._rewrite(set(keys), change)
+        return deleted
+
+    # Rewrite the whole file, passing every row whose key is in keys through
+    # change() (a None result drops the row). Returns the set of keys matched.
+    # Raises DuplicateEntryError, changing nothing, if a row outside keys
+    # already has one of the keys in taken.
+    def _rewrite(self, keys, change, taken=()):
+        with self.lock, self.file_lock, span('csv.rewrite', keys=len(keys)) as trace:
+            rows = []
+            found = set()
+            with open(self.path, mode='r', newline='') as file:
+                trace.count(bytes_read=os.fstat(file.fileno()).st_size)
+                reader = csv.reader(file)
+                next(reader, None)  # Skip header row
+                scanned = 0
+                for row in reader:
+                    scanned += 1
+                    key = make_key(row[0], row[1]) if len(row) == 5 else None
+                    if key in keys:
+                        found.add(key)
+                        row = change(row)
+                        if row is None:
+                            continue
+                    elif key in taken:
+                        raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+                    rows.append(row)
+            trace.count(rows_scanned=scanned)
+
+            if found:
+                # Write a temporary copy and swap it in, so a crash mid-write
+                # leaves the previous log intact
+                write_log_file(self.path + '.tmp', rows)
+                trace.count(rows_written=len(rows), bytes_written=os.path.getsize(self.path + '.tmp'))
+                os.replace(self.path + '.tmp', self.path)
+                count_rewrite(self.path)
+                if self.key_hashes is not None:
+                    self.key_hashes = {hash(make_key(row[0], row[1])) for row in rows if len(row) == 5}
+                    self.key_hashes_at = self._file_state()
+            return found
+
+    # Hashes of the keys in the file, brought up to date by reading only
+    # what was appended since the last call if that is all that changed.
+    # Caller holds the file lock.
+    def _key_hashes(self):
+        state = self._file_state()
+        old = self.key_hashes_at
+        start = 0
+        if self.key_hashes is not None and self._only_appended(old, state):
+            start = old[3]
+        else:
+            self.key_hashes = set()
+        if start < state[3]:
+            with span('csv.key_hashes') as trace, open(self.path, mode='rb') as file:
+                file.seek(start)
+                reader = csv.reader(io.TextIOWrapper(file, newline=''))
+                if start == 0:
+                    next(reader, None)  # Skip header row
+                for row in reader:
+                    if len(row) == 5:
+                        self.key_hashes.add(hash(make_key(row[0], row[1])))
+                trace.count(bytes_read=state[3] - start)
+        self.key_hashes_at = state
+        return self.key_hashes
+
+    # Whether the file in state is the one old was taken of with rows
+    # appended: not rewritten by the tracker since, the same inode, and the
+    # same bytes at the end of what old covered; unchanged to the nanosecond
+    # if it has not grown
+    def _only_appended(self, old, state):
+        if state[:2] != old[:2] or state[3] < old[3]:
+            return False
+        if state[3] == old[3]:
+            return state[2] == old[2] and state[4] == old[4]
+        return self._file_check(old[3]) == old[4]
+    def _has_key(self, key):
+        with open(self.path, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header row
+            return any(len(row) == 5 and make_key(row[0], row[1]) == key for row in reader)
+
+    # (inode, rewrite count, modification time, size, CRC32 of the last 4 KB)
+    # of the log: an append keeps the inode and the bytes before it, a rewrite
+    # replaces the file and is counted
+    def _file_state(self):
+        generation = rewrite_generation(self.path)
+        stat = os.stat(self.path)
+        return stat.st_ino, generation, stat.st_mtime_ns, stat.st_size, self._file_check(stat.st_size)
+
+    def _file_check(self, size):
+        with open(self.path, mode='rb') as file:
+            file.seek(max(0, size - 4096))
+            return zlib.crc32(file.read(size - file.tell()))
+
+
+# Indexed backend: an SQLite database with a unique (work order, serial) index,
+# so point updates and deletes are a B-tree lookup instead of a file rewrite
+class SqliteStorage:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.lock = threading.RLock()
+
+    def initialize(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS log ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " work_order TEXT NOT NULL,"
+            " serial_number TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " notes TEXT NOT NULL DEFAULT '',"
+            " timestamp TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS log_key ON log (work_order, serial_number)")
+        # For filtered exports by status and/or date
+        self.conn.execute("CREATE INDEX IF NOT EXISTS log_status_timestamp ON log (status, timestamp)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS log_timestamp ON log (timestamp)")
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def rows(self):
+        return self.select(LogFilter())
+
+    # Rows matching log_filter, in the order they were added
+    def select(self, log_filter):
+        where, params = log_filter.where()
+        with span('sqlite.rows', filtered=bool(where)) as trace:
+            with self.lock:
+                cursor = self.conn.execute(
+                    "SELECT work_order, serial_number, status, notes, timestamp FROM log" + where + " ORDER BY id",
+                    params,
+                )
+            while True:
+                # Fetch in slices so writers on other threads are not held up
+                with self.lock:
+                    batch = cursor.fetchmany(1000)
+                if not batch:
+                    break
+                trace.count(rows_scanned=len(batch))
+                for row in batch:
+                    yield list(row)
+
+    def add(self, work_order, serial_number, status, notes, timestamp):
+        self.add_many([[work_order, serial_number, status, notes, timestamp]])
+
+    # Insert complete rows in one transaction
+    def add_many(self, rows):
+        rows = [make_key(row[0], row[1]) + tuple(row[2:5]) for row in rows]
+        try:
+            with self.lock, self.conn, span('sqlite.add_many') as trace:
+                trace.count(rows_written=len(rows))
+                self.conn.executemany(
+                    "INSERT INTO log (work_order, serial_number, status, notes, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.IntegrityError as e:
+            key = self._duplicate_key(rows)
+            if key is None:
+                raise DuplicateEntryError(f"Entry already exists: {e}")
+            raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+
+    # The first key of rows that is already in the log or earlier in rows,
+    # to name it after the insert was refused
+    def _duplicate_key(self, rows):
+        keys = set()
+        with self.lock:
+            for row in rows:
+                key = row[:2]
+                if key in keys or self.conn.execute(
+                    "SELECT 1 FROM log WHERE work_order = ? AND serial_number = ?", key
+                ).fetchone():
+                    return key
+                keys.add(key)
+        return None
+
+    def update_status(self, work_order, serial_number, new_status, timestamp):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE log SET status = ?, timestamp = ? WHERE work_order = ? AND serial_number = ?",
+                (new_status, timestamp) + make_key(work_order, serial_number),
+            )
+        return cursor.rowcount > 0
+
+    # Apply many status changes ({key: new status}) in one transaction.
+    # Returns the set of keys that were found.
+    def update_status_many(self, changes, timestamp):
+        found = set()
+        with self.lock, self.conn, span('sqlite.update_status_many', keys=len(changes)) as trace:
+            for key, new_status in changes.items():
+                cursor = self.conn.execute(
+                    "UPDATE log SET status = ?, timestamp = ? WHERE work_order = ? AND serial_number = ?",
+                    (new_status, timestamp) + key,
+                )
+                if cursor.rowcount > 0:
+                    found.add(key)
+            trace.count(rows_written=len(found))
+        return found
+
+    def edit(self, work_order, serial_number, new_work_order, new_serial_number, new_status, new_notes):
+        new_work_order, new_serial_number = make_key(new_work_order, new_serial_number)
+        try:
+            with self.lock, self.conn:
+                cursor = self.conn.execute(
+                    "UPDATE log SET work_order = ?, serial_number = ?, status = ?, notes = ?"
+                    " WHERE work_order = ? AND serial_number = ?",
+                    (new_work_order, new_serial_number, new_status, new_notes) + make_key(work_order, serial_number),
+                )
+        except sqlite3.IntegrityError:
+            raise DuplicateEntryError(f"Work Order {new_work_order} / Serial Number {new_serial_number} already exists")
+        return cursor.rowcount > 0
+
+    def delete(self, work_order, serial_number):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM log WHERE work_order = ? AND serial_number = ?",
+                make_key(work_order, serial_number),
+            )
+        return cursor.rowcount > 0
+
+    # Delete many entries in one transaction; returns the set of keys
+    # deleted. With expected ({key: row}), an entry is only deleted while its
+    # row is still exactly that one.
+    def delete_many(self, keys, expected=None):
+        found = set()
+        with self.lock, self.conn:
+            for key in keys:
+                if expected is None:
+                    cursor = self.conn.execute("DELETE FROM log WHERE work_order = ? AND serial_number = ?", key)
+                else:
+                    cursor = self.conn.execute(
+                        "DELETE FROM log WHERE work_order = ? AND serial_number = ? AND status = ? AND notes = ?"
+                        " AND timestamp = ?", (*key, *expected[key][2:5]))
+                if cursor.rowcount > 0:
+                    found.add(key)
+        return found
+
+
+# Journal backend: every add, status change, edit and delete is appended to a
+# small JSON-lines journal and the current log is rebuilt by replaying it on
+# top of the last snapshot (the regular CSV log file). Once the journal grows
+# past compact_bytes it is frozen and folded into a new snapshot on a
+# background thread; folded journal segments are kept in the audit file.
+class JournalStorage:
+    def __init__(self, path, compact_bytes=1000000):
+        self.path = path
+        base = os.path.splitext(path)[0]
+        self.journal_path = base + '.journal'
+        self.compacting_path = base + '.journal.compacting'
+        self.compacted_path = base + '.journal.compacted'
+        self.snapshot_tmp_path = path + '.tmp'
+        self.audit_path = base + '.audit'
+        self.open_lock = FileLock(base + '.journal.lock', blocking=False)
+        self.compact_bytes = compact_bytes
+        self.records = {}
+        self.time_index = None
+        self.batching = False  # The TimeIndex follows self.records as it would a RecordStore's
+        self.journal = None
+        self.compactor = None
+        self.lock = threading.Lock()
+
+    # Held for as long as the log is open: a second process replaying and
+    # compacting the same journal from its own copy of the records would
+    # write a snapshot without this one's changes
+    def initialize(self):
+        try:
+            self.open_lock.acquire()
+        except BlockingIOError:
+            raise LogInUseError(f"{self.path} is already open with the journal backend in another program or at"
+                                " another station; close it there first") from None
+        try:
+            self._load()
+        except BaseException:
+            self.open_lock.release()
+            raise
+
+    def _load(self):
+        from lcd_model import TimeIndex  # lcd_model imports this module
+        CsvStorage(self.path).initialize()
+        self._recover()
+        self.records = {}
+        self.time_index = None
+        with open(self.path, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header row
+            for row in reader:
+                if len(row) == 5:
+                    self.records[make_key(row[0], row[1])] = row
+                else:
+                    logger.warning("Skipping malformed row in %s: %s", self.path, row)
+        if os.path.exists(self.compacting_path):
+            # A previous compaction never installed its snapshot: fold the
+            # frozen segment in again before replaying the live journal
+            self._replay(self.compacting_path)
+            self._start_compaction()
+        self._replay(self.journal_path)
+        # Built once the replay is done; kept up to date by _apply from here on
+        self.time_index = TimeIndex()
+        self.time_index.on_reset(self)
+        self.journal = open(self.journal_path, mode='a', encoding='utf-8')
+
+    def close(self):
+        if self.compactor is not None:
+            self.compactor.join()
+            self.compactor = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.open_lock.file is not None:
+            self.open_lock.release()
+
+    def rows(self):
+        with self.lock:
+            rows = [list(row) for row in self.records.values()]
+        for row in rows:
+            yield row
+
+    def select(self, log_filter):
+        with self.lock:
+            if log_filter.since or log_filter.until:
+                rows = (self.records[key] for key in self.time_index.between(log_filter.since, log_filter.until))
+            else:
+                rows = self.records.values()
+            rows = [list(row) for row in rows if log_filter.matches(row)]
+        for row in rows:
+            yield row
+
+    def add(self, work_order, serial_number, status, notes, timestamp):
+        self.add_many([[work_order, serial_number, status, notes, timestamp]])
+
+    # Journal complete rows with a single flush to disk
+    def add_many(self, rows):
+        records = []
+        with self.lock:
+            keys = set()
+            for row in rows:
+                key = make_key(row[0], row[1])
+                if key in self.records or key in keys:
+                    raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+                keys.add(key)
+                records.append({'op': 'add', 'row': [key[0], key[1]] + list(row[2:5])})
+            self._commit(*records)
+
+    def update_status(self, work_order, serial_number, new_status, timestamp):
+        key = make_key(work_order, serial_number)
+        with self.lock:
+            row = self.records.get(key)
+            if row is None:
+                return False
+            self._commit({'op': 'status', 'key': list(key), 'from': row[2], 'status': new_status, 'timestamp': timestamp})
+        return True
+
+    # Journal many status changes ({key: new status}) with a single flush.
+    # Returns the set of keys that were found.
+    def update_status_many(self, changes, timestamp):
+        records = []
+        with self.lock:
+            for key, new_status in changes.items():
+                row = self.records.get(key)
+                if row is not None:
+                    records.append({'op': 'status', 'key': list(key), 'from': row[2], 'status': new_status, 'timestamp': timestamp})
+            if records:
+                self._commit(*records)
+        return {tuple(record['key']) for record in records}
+
+    def edit(self, work_order, serial_number, new_work_order, new_serial_number, new_status, new_notes):
+        key = make_key(work_order, serial_number)
+        new_key = make_key(new_work_order, new_serial_number)
+        with self.lock:
+            row = self.records.get(key)
+            if row is None:
+                return False
+            if new_key != key and new_key in self.records:
+                raise DuplicateEntryError(f"Work Order {new_key[0]} / Serial Number {new_key[1]} already exists")
+            # Keep the original timestamp
+            new_row = [new_key[0], new_key[1], new_status, new_notes, row[4]]
+            self._commit({'op': 'edit', 'key': list(key), 'from': row[2], 'row': new_row})
+        return True
+
+    def delete(self, work_order, serial_number):
+        key = make_key(work_order, serial_number)
+        with self.lock:
+            if key not in self.records:
+                return False
+            self._commit({'op': 'delete', 'key': list(key)})
+        return True
+
+    # Journal many deletes with a single flush; returns the set of keys
+    # deleted. With expected ({key: row}), an entry is only deleted while its
+    # row is still exactly that one.
+    def delete_many(self, keys, expected=None):
+        with self.lock:
+            found = {key for key in keys if key in self.records
+                     and (expected is None or self.records[key] == list(expected[key]))}
+            if found:
+                self._commit(*({'op': 'delete', 'key': list(key)} for key in found))
+        return found
+
+    # Status transitions recorded for one entry, oldest first, as (time, old
+    # status, new status), read from the audit file and any journal segments
+    # that have not been folded in yet. Edits that change the key are
+    # followed both ways, so the entry can be given by its current key or any
+    # key it had before; a key reused after a delete means the newest entry.
+    def history(self, work_order, serial_number):
+        key = make_key(work_order, serial_number)
+        entries = {}  # key -> transitions of the entry it is now
+        found = None
+        for path in (self.audit_path, self.compacted_path, self.compacting_path, self.journal_path):
+            for record in self._read_journal(path)[0]:
+                op = record['op']
+                if op == 'add':
+                    record_key = make_key(*record['row'][:2])
+                    entries[record_key] = [(record['at'], None, record['row'][2])]
+                else:
+                    # An entry from before the journal has no add record
+                    record_key = tuple(record['key'])
+                    entries.setdefault(record_key, [])
+                if op in ('status', 'edit'):
+                    new_status = record['status'] if op == 'status' else record['row'][2]
+                    if new_status != record['from']:
+                        entries[record_key].append((record['at'], record['from'], new_status))
+                if op == 'edit':
+                    new_key = make_key(*record['row'][:2])
+                    if new_key != record_key:
+                        entries[new_key] = entries.pop(record_key)
+                elif op == 'delete':
+                    del entries[record_key]
+                if key in entries:
+                    found = entries[key]  # Kept when the entry moves on or is deleted
+        return found or []
+
+    # Append records to the journal, apply them in memory and start a
+    # compaction if the journal is past its size threshold. Caller holds the lock.
+    def _commit(self, *records):
+        at = make_timestamp()
+        with span('journal.commit') as trace:
+            start = self.journal.tell()
+            for record in records:
+                record['at'] = at
+                self.journal.write(json.dumps(record) + '\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            trace.count(rows_written=len(records), bytes_written=self.journal.tell() - start)
+        for record in records:
+            self._apply(record)
+        if self.journal.tell() >= self.compact_bytes and not (self.compactor and self.compactor.is_alive()):
+            self.journal.close()
+            os.replace(self.journal_path, self.compacting_path)
+            self.journal = open(self.journal_path, mode='a', encoding='utf-8')
+            self._start_compaction()
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'add':
+            row = list(record['row'])
+            key = make_key(row[0], row[1])
+            self._put(key if key in self.records else None, key, row)
+            return
+        key = tuple(record['key'])
+        row = self.records.get(key)
+        if row is None:
+            return
+        if op == 'status':
+            self._put(key, key, row[:2] + [record['status'], row[3], record['timestamp']])
+        elif op == 'edit':
+            new_row = list(record['row'])
+            self._put(key, make_key(new_row[0], new_row[1]), new_row)
+        elif op == 'delete':
+            del self.records[key]
+            if self.time_index is not None:
+                self.time_index.on_delete(key, row)
+
+    # Store row under key in place of the record at old_key (None for a new
+    # record), keeping the time index in step
+    def _put(self, old_key, key, row):
+        old_row = self.records.get(old_key) if old_key is not None else None
+        if old_key is not None and old_key != key:
+            del self.records[old_key]
+        self.records[key] = row
+        if self.time_index is not None:
+            if old_row is None:
+                self.time_index.on_insert(key, row)
+            else:
+                self.time_index.on_update(old_key, key, old_row, row)
+
+    def _replay(self, path):
+        records, good_bytes = self._read_journal(path)
+        for record in records:
+            self._apply(record)
+        if os.path.exists(path) and os.path.getsize(path) != good_bytes:
+            # Drop a record torn by a crash mid-append so new records start on a clean line
+            logger.warning("Discarding incomplete record at the end of %s", path)
+            with open(path, mode='r+b') as file:
+                file.truncate(good_bytes)
+
+    # Read every complete record from a journal file. Returns the records and
+    # the byte length of the intact prefix.
+    @staticmethod
+    def _read_journal(path):
+        records = []
+        good_bytes = 0
+        if not os.path.exists(path):
+            return records, good_bytes
+        with open(path, mode='rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                good_bytes += len(line)
+        return records, good_bytes
+
+    def _start_compaction(self):
+        rows = [list(row) for row in self.records.values()]
+        self.compactor = threading.Thread(target=self._compact, args=(rows,), daemon=True)
+        self.compactor.start()
+
+    # Runs on the compactor thread. Renaming the frozen segment to
+    # .compacted is the commit point: after it, recovery installs the new
+    # snapshot instead of replaying the segment.
+    def _compact(self, rows):
+        with span('journal.compact') as trace:
+            write_log_file(self.snapshot_tmp_path, rows)
+            trace.count(rows_written=len(rows), bytes_written=os.path.getsize(self.snapshot_tmp_path))
+        os.replace(self.compacting_path, self.compacted_path)
+        os.replace(self.snapshot_tmp_path, self.path)
+        count_rewrite(self.path)
+        self._archive_segment()
+
+    def _archive_segment(self):
+        with open(self.compacted_path, mode='rb') as segment, open(self.audit_path, mode='ab') as audit:
+            audit.write(segment.read())
+            audit.flush()
+            os.fsync(audit.fileno())
+        os.remove(self.compacted_path)
+
+    # Finish or roll back a compaction interrupted by a crash
+    def _recover(self):
+        if os.path.exists(self.compacted_path):
+            if os.path.exists(self.snapshot_tmp_path):
+                os.replace(self.snapshot_tmp_path, self.path)
+                count_rewrite(self.path)
+            self._archive_segment()
+        elif os.path.exists(self.snapshot_tmp_path):
+            os.remove(self.snapshot_tmp_path)
+
+
+# Function to copy an existing CSV log into an SQLite database (one-shot).
+# Rows with a duplicate key overwrite the earlier record, matching how the
+# CSV backend applied updates to every copy. Rows holding bytes that are not
+# valid text are skipped and their line numbers logged. The database is built
+# under a temporary name and only moved to db_path once it is complete, so a
+# failed migration leaves nothing behind and is simply run again next time.
+# Returns (imported, duplicates, skipped, undecodable).
+def migrate_csv_to_sqlite(csv_path, db_path):
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)  # Left by a migration that was interrupted
+    storage = SqliteStorage(tmp_path)
+    storage.initialize()
+    imported = duplicates = skipped = 0
+    undecodable = []
+    seen = set()
+    try:
+        # surrogateescape turns undecodable bytes into lone surrogates, which
+        # cannot be encoded again; that is how such rows are spotted
+        with storage.conn, open(csv_path, mode='r', newline='', errors='surrogateescape') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header row
+            for row in reader:
+                try:
+                    '\n'.join(row).encode('utf-8')
+                except UnicodeEncodeError:
+                    undecodable.append(reader.line_num)
+                    continue
+                if len(row) != 5:
+                    skipped += 1
+                    continue
+                key = make_key(row[0], row[1])
+                if key in seen:
+                    duplicates += 1
+                else:
+                    seen.add(key)
+                    imported += 1
+                storage.conn.execute(
+                    "INSERT INTO log (work_order, serial_number, status, notes, timestamp) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (work_order, serial_number) DO UPDATE SET"
+                    " status = excluded.status, notes = excluded.notes, timestamp = excluded.timestamp",
+                    key + (row[2], row[3], row[4]),
+                )
+    except BaseException:
+        storage.close()
+        os.remove(tmp_path)
+        raise
+    storage.close()
+    os.replace(tmp_path, db_path)
+    if undecodable:
+        logger.warning("Skipped %d rows of %s that are not valid text, at lines %s", len(undecodable), csv_path,
+                       ", ".join(map(str, undecodable[:20])) + (" ..." if len(undecodable) > 20 else ""))
+    return imported, duplicates, skipped, len(undecodable)
+
+
+# Function to open the configured backend. The first time the SQLite backend is
+# used next to an existing CSV log, the CSV is migrated into the new database.
+def open_storage(kind, csv_path):
+    if kind == 'csv':
+        storage = CsvStorage(csv_path)
+    elif kind == 'sqlite':
+        db_path = os.path.splitext(csv_path)[0] + '.db'
+        if not os.path.exists(db_path) and os.path.exists(csv_path):
+            imported, duplicates, skipped, undecodable = migrate_csv_to_sqlite(csv_path, db_path)
+            logger.warning("Migrated %d entries from %s to %s (%d duplicate keys merged, %d malformed rows skipped,"
+                           " %d undecodable rows skipped)", imported, csv_path, db_path, duplicates, skipped, undecodable)
+        storage = SqliteStorage(db_path)
+    elif kind == 'journal':
+        storage = JournalStorage(csv_path)
+    else:
+        raise ValueError(f"Unknown storage backend: {kind}")
+    storage.initialize()
+    return storage
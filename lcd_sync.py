@@ -0,0 +1,320 @@
+import argparse
+import itertools
+import json
+import socket
+import socketserver
+import threading
+
+from lcd_model import RecordStore, TimeIndex
+from lcd_storage import DuplicateEntryError, LogFilter, make_key, open_storage
+from lcd_trace import configure_logging, logger, span
+
+DEFAULT_PORT = 50507
+
+
+# Function to turn "host:port" (or just "host") into a socket address
+def parse_address(text):
+    host, _, port = text.rpartition(':') if ':' in text else (text, '', '')
+    return (host or '127.0.0.1', int(port or DEFAULT_PORT))
+
+
+# Function to apply a change event from the server to a RecordStore. Events
+# are applied idempotently so one that repeats what the store already shows
+# (such as this station's own change) is harmless.
+def apply_change(store, event):
+    kind = event['event']
+    if kind == 'reset':
+        store.load(event['rows'])
+    elif kind == 'insert':
+        store.add_many(event['rows'])
+    elif kind == 'update':
+        key = tuple(event['key'])
+        row = event['row']
+        new_key = make_key(row[0], row[1])
+        if key in store:
+            if new_key == key or new_key not in store:
+                store.update(key, row)
+        elif new_key in store:
+            store.update(new_key, row)
+        else:
+            store.add(row)
+    elif kind == 'delete':
+        store.remove(tuple(event['key']))
+
+
+# Single-writer server that owns the log. Every station's GUI connects to it
+# instead of opening the log file; writes are applied one at a time, and each
+# one is pushed as a change event to every connected station.
+#
+# Messages are JSON, one per line. Requests carry an id that is echoed in
+# the response; events carry a sequence number instead.
+class LogServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, storage):
+        super().__init__(address, LogClientHandler)
+        self.storage = storage
+        self.store = RecordStore()
+        self.time_index = TimeIndex()
+        self.store.subscribe(self.time_index)
+        self.store.load(storage.rows())
+        self.write_lock = threading.Lock()
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self.seq = 0
+
+    def add_client(self, client):
+        with self.clients_lock:
+            self.clients.add(client)
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            self.clients.discard(client)
+
+    # Send an event to every station. Called with write_lock held, so all
+    # stations see events in the same order.
+    def broadcast(self, event):
+        self.seq += 1
+        event['seq'] = self.seq
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.send(event)
+            except OSError:
+                self.remove_client(client)
+
+    def dispatch(self, request):
+        op = request['op']
+        with self.write_lock, span('server.' + op):
+            if op == 'rows':
+                return {'seq': self.seq, 'rows': [list(row) for row in self.store.rows()]}
+            if op == 'select':
+                log_filter = LogFilter(**request['filter'])
+                if log_filter.since or log_filter.until:
+                    rows = (self.store.get(key) for key in self.time_index.between(log_filter.since, log_filter.until))
+                else:
+                    rows = self.store.rows()
+                return [list(row) for row in rows if log_filter.matches(row)]
+            if op == 'add':
+                rows = request['rows']
+                keys = set()
+                for row in rows:
+                    key = make_key(row[0], row[1])
+                    if key in self.store or key in keys:
+                        raise DuplicateEntryError(f"Work Order {key[0]} / Serial Number {key[1]} already exists")
+                    keys.add(key)
+                self.storage.add_many(rows)
+                self.store.add_many(rows)
+                self.broadcast({'event': 'insert', 'rows': rows})
+                return None
+            if op == 'update_status_many':
+                changes = {make_key(wo, sn): status for wo, sn, status in request['changes']}
+                found = self.storage.update_status_many(changes, request['timestamp'])
+                for key in found:
+                    if self.store.set_status(key, changes[key], request['timestamp']):
+                        self.broadcast({'event': 'update', 'key': key, 'row': list(self.store.get(key))})
+                return [list(key) for key in found]
+            if op == 'delete_many':
+                expected = request.get('expected')
+                if expected is not None:
+                    expected = {make_key(row[0], row[1]): row for row in expected}
+                found = self.storage.delete_many({tuple(key) for key in request['keys']}, expected)
+                for key in found:
+                    if self.store.remove(key):
+                        self.broadcast({'event': 'delete', 'key': key})
+                return [list(key) for key in found]
+            key = tuple(request['key'])
+            if op == 'update_status':
+                found = self.storage.update_status(key[0], key[1], request['status'], request['timestamp'])
+                if found and self.store.set_status(key, request['status'], request['timestamp']):
+                    self.broadcast({'event': 'update', 'key': key, 'row': list(self.store.get(key))})
+                return found
+            if op == 'edit':
+                row = self.store.get(key)
+                new_key = make_key(request['work_order'], request['serial_number'])
+                if new_key != key and new_key in self.store:
+                    raise DuplicateEntryError(f"Work Order {new_key[0]} / Serial Number {new_key[1]} already exists")
+                found = self.storage.edit(key[0], key[1], new_key[0], new_key[1], request['status'], request['notes'])
+                if found and row is not None:
+                    # Keep the original timestamp
+                    new_row = [new_key[0], new_key[1], request['status'], request['notes'], row[4]]
+                    self.store.update(key, new_row)
+                    self.broadcast({'event': 'update', 'key': key, 'row': new_row})
+                return found
+            if op == 'delete':
+                found = self.storage.delete(key[0], key[1])
+                if self.store.remove(key):
+                    self.broadcast({'event': 'delete', 'key': key})
+                return found
+        raise ValueError(f"Unknown request: {op}")
+
+
+class LogClientHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        self.server.add_client(self)
+
+    def handle(self):
+        for line in self.rfile:
+            request = json.loads(line)
+            response = {'id': request['id']}
+            try:
+                response['result'] = self.server.dispatch(request)
+            except DuplicateEntryError as e:
+                response['error'] = str(e)
+                response['duplicate'] = True
+            except Exception as e:
+                response['error'] = str(e)
+            self.send(response)
+
+    def finish(self):
+        self.server.remove_client(self)
+        super().finish()
+
+    def send(self, message):
+        with self.send_lock:
+            self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+# Storage backend that forwards every call to a LogServer. Change events
+# pushed by the server (including this station's own) are passed to
+# on_change in server order; request_snapshot() fetches the full log as a
+# 'reset' event in that same stream, so a reload can never overtake a change.
+class RemoteStorage:
+    def __init__(self, address):
+        self.address = address
+        self.sock = None
+        self.writer = None
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.on_change = None
+        self.buffered = []
+        self.listener_lock = threading.Lock()
+        self.connected = False
+
+    def initialize(self):
+        self.sock = socket.create_connection(self.address)
+        self.writer = self.sock.makefile('wb')
+        self.connected = True
+        threading.Thread(target=self._read_loop, args=(self.sock.makefile('rb'),), daemon=True).start()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # Start passing change events to on_change, beginning with any that
+    # arrived before there was somewhere to send them
+    def listen(self, on_change):
+        with self.listener_lock:
+            self.on_change = on_change
+            for event in self.buffered:
+                on_change(event)
+            self.buffered = []
+
+    def rows(self):
+        return self._call({'op': 'rows'})['rows']
+
+    def select(self, log_filter):
+        return self._call({'op': 'select', 'filter': vars(log_filter)})
+
+    def request_snapshot(self):
+        self._call({'op': 'rows'}, snapshot=True)
+
+    def add(self, work_order, serial_number, status, notes, timestamp):
+        self.add_many([[work_order, serial_number, status, notes, timestamp]])
+
+    def add_many(self, rows):
+        self._call({'op': 'add', 'rows': [list(make_key(row[0], row[1])) + list(row[2:5]) for row in rows]})
+
+    def update_status(self, work_order, serial_number, new_status, timestamp):
+        return self._call({'op': 'update_status', 'key': make_key(work_order, serial_number),
+                           'status': new_status, 'timestamp': timestamp})
+
+    def update_status_many(self, changes, timestamp):
+        found = self._call({'op': 'update_status_many', 'timestamp': timestamp,
+                            'changes': [[key[0], key[1], status] for key, status in changes.items()]})
+        return {tuple(key) for key in found}
+
+    def edit(self, work_order, serial_number, new_work_order, new_serial_number, new_status, new_notes):
+        return self._call({'op': 'edit', 'key': make_key(work_order, serial_number),
+                           'work_order': new_work_order, 'serial_number': new_serial_number,
+                           'status': new_status, 'notes': new_notes})
+
+    def delete(self, work_order, serial_number):
+        return self._call({'op': 'delete', 'key': make_key(work_order, serial_number)})
+
+    def delete_many(self, keys, expected=None):
+        request = {'op': 'delete_many', 'keys': [list(key) for key in keys]}
+        if expected is not None:
+            request['expected'] = [list(row) for row in expected.values()]
+        return {tuple(key) for key in self._call(request)}
+
+    # Send a request and block until its response arrives
+    def _call(self, request, snapshot=False):
+        request['id'] = next(self.ids)
+        slot = {'done': threading.Event(), 'snapshot': snapshot}
+        self.pending[request['id']] = slot
+        if not self.connected:
+            raise OSError("Not connected to the log server")
+        with self.send_lock:
+            self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+            self.writer.flush()
+        slot['done'].wait()
+        response = slot['response']
+        if 'error' in response:
+            if response.get('duplicate'):
+                raise DuplicateEntryError(response['error'])
+            raise OSError(f"Log server error: {response['error']}")
+        return response.get('result')
+
+    def _emit(self, event):
+        with self.listener_lock:
+            if self.on_change is None:
+                self.buffered.append(event)
+            else:
+                self.on_change(event)
+
+    def _read_loop(self, reader):
+        try:
+            for line in reader:
+                message = json.loads(line)
+                if 'event' in message:
+                    self._emit(message)
+                    continue
+                slot = self.pending.pop(message['id'])
+                if slot['snapshot'] and 'result' in message:
+                    self._emit({'event': 'reset', 'seq': message['result']['seq'], 'rows': message['result']['rows']})
+                slot['response'] = message
+                slot['done'].set()
+        finally:
+            # Fail any request still waiting once the connection is gone
+            self.connected = False
+            for slot in list(self.pending.values()):
+                slot['response'] = {'error': 'connection to the log server was lost'}
+                slot['done'].set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the LCD log to several workstations.")
+    parser.add_argument('--listen', default=f"127.0.0.1:{DEFAULT_PORT}",
+                        help="address to listen on (use 0.0.0.0:PORT for other machines)")
+    parser.add_argument('--log', default='lcd_log.csv', help="log file to serve")
+    parser.add_argument('--storage', default='csv', choices=['csv', 'sqlite', 'journal'])
+    args = parser.parse_args()
+    configure_logging('INFO')
+
+    server = LogServer(parse_address(args.listen), open_storage(args.storage, args.log))
+    logger.info("Serving %s on %s", args.log, args.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.storage.close()
@@ -0,0 +1,153 @@
+import atexit
+import collections
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Logging and timing spans for the tracker, off unless switched on:
+#
+#   LCD_LOG_LEVEL=debug|info|warning|error  messages shown (default warning)
+#   LCD_TRACE=1                             record a timing span per operation
+#   LCD_TRACE=trace.json                    ...and write them there on exit
+#
+# A span records wall time plus counts such as rows scanned and bytes read or
+# written. Recent spans are kept in memory for the stats panel and can be
+# exported in Chrome trace format (open in chrome://tracing or Perfetto).
+# With tracing off, span() returns a shared do-nothing span.
+
+logger = logging.getLogger('lcd')
+
+TRACE_SETTING = os.environ.get('LCD_TRACE', '')
+tracing = TRACE_SETTING not in ('', '0')
+
+
+# Function to set up logging for a program entry point (GUI, CLI or server)
+def configure_logging(default_level='WARNING'):
+    level = os.environ.get('LCD_LOG_LEVEL', default_level).upper()
+    logging.basicConfig(level=level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+def enable_tracing(enabled=True):
+    global tracing
+    tracing = enabled
+
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.counts = {}
+        self.start = None
+        self.duration = None
+        self.thread = None
+        self.failed = False
+
+    # Add to the span's counters, e.g. count(rows_scanned=1000, bytes_read=4096)
+    def count(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def __enter__(self):
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._started
+        self.thread = threading.current_thread().name
+        self.failed = exc_type is not None
+        recorder.record(self)
+        if logger.isEnabledFor(logging.DEBUG):
+            details = " ".join(f"{name}={value}" for name, value in {**self.fields, **self.counts}.items())
+            logger.debug("%s %.2f ms %s%s", self.name, self.duration * 1000, details, " (failed)" if self.failed else "")
+        return False
+
+
+class NullSpan:
+    def count(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+# Keeps the most recent spans plus per-operation totals
+class TraceRecorder:
+    def __init__(self, keep=2000):
+        self.recent = collections.deque(maxlen=keep)
+        self.totals = {}  # name -> [calls, total seconds, slowest seconds]
+        self.lock = threading.Lock()
+
+    def record(self, span):
+        with self.lock:
+            self.recent.append(span)
+            totals = self.totals.setdefault(span.name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += span.duration
+            totals[2] = max(totals[2], span.duration)
+
+    def clear(self):
+        with self.lock:
+            self.recent.clear()
+            self.totals = {}
+
+    # The slowest of the recent spans, slowest first
+    def slowest(self, limit=20):
+        with self.lock:
+            spans = list(self.recent)
+        return sorted(spans, key=lambda span: span.duration, reverse=True)[:limit]
+
+    # (name, calls, total seconds, slowest seconds) per operation, most total time first
+    def summary(self):
+        with self.lock:
+            totals = [(name,) + tuple(values) for name, values in self.totals.items()]
+        return sorted(totals, key=lambda entry: entry[2], reverse=True)
+
+    # Write the recent spans as a Chrome trace-event file
+    def export(self, path):
+        with self.lock:
+            spans = list(self.recent)
+        events = [{
+            'name': span.name,
+            'ph': 'X',
+            'ts': span.start * 1000000,
+            'dur': span.duration * 1000000,
+            'pid': os.getpid(),
+            'tid': span.thread,
+            'args': {**span.fields, **span.counts, 'failed': span.failed},
+        } for span in spans]
+        with open(path, mode='w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+recorder = TraceRecorder()
+
+if tracing and TRACE_SETTING.endswith('.json'):
+    atexit.register(recorder.export, TRACE_SETTING)
+
+
+# Function to start a timing span: with span('csv.rewrite') as s: ... s.count(rows_scanned=n)
+def span(name, **fields):
+    if not tracing:
+        return NULL_SPAN
+    return Span(name, fields)
+
+
+# Decorator that runs every call of a function inside a span
+def traced(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
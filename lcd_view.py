@@ -0,0 +1,332 @@
+import heapq
+
+from lcd_model import SortOrders, merged_nth, merged_rank, merged_slice, order_entry
+
+
+# Shows a RecordStore in a ttk.Treeview without creating an item per record.
+# The tree holds a small pool of items covering the rows on screen plus a
+# prefetch margin above and below; scrolling inside the pool is left to Tk,
+# and when the view gets within the margin of either end the pool is refilled
+# with the slice of rows around it. The scrollbar is driven from the full row
+# count, so it still spans the whole log.
+#
+# The order rows are shown in comes from a SortOrders kept up to date with
+# the store: sorting on a column or showing only some statuses just picks
+# other sorted lists from it, and only the pooled items are rewritten.
+class VirtualTreeview:
+    def __init__(self, tree, scrollbar, pool_size=200, margin=50):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.pool_size = pool_size
+        self.margin = margin
+        self.store = None
+        self.orders = SortOrders()
+        self.sort_column = None
+        self.sort_reverse = False
+        self.statuses = None  # statuses shown, None for all
+        self.offset = 0  # display position of the first pooled item
+        self.items = []  # pooled item ids, top to bottom
+        self.keys = {}  # pooled item id -> key
+        self.slots = {}  # key -> pooled item id
+        self.selected_key = None
+        self.stale = False
+        tree.configure(selectmode='browse', yscrollcommand=self.on_tree_scroll)
+        scrollbar.configure(command=self.on_scrollbar)
+
+    # Number of rows shown
+    def __len__(self):
+        return sum(map(len, self._lists()))
+
+    # Key shown by a pooled Treeview item
+    def key_for(self, item):
+        return self.keys.get(item)
+
+    def selected(self):
+        selection = self.tree.selection()
+        if selection:
+            self.selected_key = self.keys.get(selection[0])
+        return self.selected_key
+
+    # Keys in display order
+    def keys_in_order(self):
+        lists = self._lists()
+        if self.sort_reverse:
+            lists = [reversed(entries) for entries in lists]
+        for _, key in heapq.merge(*lists, reverse=self.sort_reverse):
+            yield key
+
+    def key_at(self, position):
+        return self._entry_at(position)[1]
+
+    # Display position of a record, or None if it is not in the store or
+    # its status is not shown
+    def position(self, key):
+        row = self.store.get(key)
+        if row is None:
+            return None
+        return self._position_of(key, row)
+
+    # The match to go to in matches, a set of keys in the store (as a
+    # SearchIndex on it returns): the first one shown after the record after
+    # in display order, wrapping round to the top (the first from the top
+    # when after is None). The display order is walked a window at a time from
+    # there, which finds a common match at once; once the walk has covered as
+    # many rows as there are matches, one pass comparing the sort entries of
+    # the matches finds it instead. Returns (key or None, number of matches
+    # shown, number hidden by the status filter).
+    def next_match(self, matches, after=None):
+        if self.statuses is None:
+            shown = len(matches)
+        else:
+            records = self.store.records
+            shown = sum(1 for key in matches if records[key][2] in self.statuses)
+        hidden = len(matches) - shown
+        if not shown:
+            return None, 0, hidden
+        total = len(self)
+        position = self.position(after) if after is not None else None
+        start = 0 if position is None else position + 1
+        walked = 0
+        while walked < total and walked < max(len(matches), self.pool_size):
+            offset = (start + walked) % total
+            count = min(self.pool_size, total - offset, total - walked)
+            for key in self._window(offset, count):
+                if key in matches:
+                    return key, shown, hidden
+            walked += count
+        return self._next_by_entry(matches, after), shown, hidden
+
+    # Scroll so the record is on screen, then select it
+    def see(self, key):
+        position = self.position(key)
+        if position is None:
+            return False
+        first, last = self._visible_range()
+        if not first <= position < last:
+            self.scroll_to(position - (last - first) // 2)
+        self.selected_key = key
+        item = self.slots[key]
+        self.tree.selection_set(item)
+        self.tree.focus(item)
+        self.tree.see(item)
+        return True
+
+    # Order rows by column index (None for the order they were added in).
+    # The first sort on a column builds its order; later ones reuse it.
+    def sort_by(self, column, reverse=False):
+        self.sort_column = column
+        self.sort_reverse = reverse
+        self._show_selected_or_top()
+
+    # Show only records whose status is in statuses (None for all)
+    def filter_statuses(self, statuses):
+        self.statuses = set(statuses) if statuses is not None else None
+        self._show_selected_or_top()
+
+    def scroll_to(self, top):
+        total = len(self)
+        first, last = self._visible_range()
+        visible = max(1, last - first)
+        top = max(0, min(top, total - visible))
+        if top < self.offset or top + visible > self.offset + len(self.items):
+            self._fill(top - (self._pool_size(visible) - visible) // 2, visible)
+        if self.items:
+            self.tree.yview_moveto((top - self.offset) / len(self.items))
+
+    # Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')
+    def on_scrollbar(self, *args):
+        first, last = self._visible_range()
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * len(self)))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= max(1, last - first)
+            self.scroll_to(first + step)
+
+    # Tree yscrollcommand: called by Tk whenever the pooled items scroll
+    def on_tree_scroll(self, first, last):
+        count = len(self.items)
+        total = len(self)
+        if count == 0:
+            self.scrollbar.set(0, 1)
+            return
+        top = self.offset + round(float(first) * count)
+        bottom = self.offset + round(float(last) * count)
+        near_top = self.offset > 0 and top - self.offset < self.margin
+        near_bottom = self.offset + count < total and self.offset + count - bottom < self.margin
+        if near_top or near_bottom:
+            visible = bottom - top
+            self._fill(top - (self._pool_size(visible) - visible) // 2, visible)
+            self.tree.yview_moveto((top - self.offset) / len(self.items))
+            return  # Tk calls back again for the new position
+        self.scrollbar.set(top / total, bottom / total)
+
+    def on_reset(self, store):
+        self.adopt(store, self.build(store.records))
+
+    # The sort orders for records, built for the columns sorted on so far
+    def build(self, records):
+        return self.orders.build(records)
+
+    def adopt(self, store, orders):
+        self.store = store
+        self.selected()
+        self.orders.adopt(store, orders)
+        self._fill(self.offset)
+
+    def on_insert(self, key, row):
+        self.orders.on_insert(key, row)
+        if self._shown(row):
+            self._changed(self.position(key), 1)
+
+    def on_update(self, old_key, key, old_row, row):
+        old_entry = self._entry(old_key, old_row)
+        old_position = self._position_of(old_key, old_row)
+        self.orders.on_update(old_key, key, old_row, row)
+        if self.selected() == old_key:
+            self.selected_key = key
+        new_position = self.position(key)
+        if old_position is None and new_position is None:
+            return  # Neither status is shown
+        if new_position is not None and old_row[2] == row[2] and self._entry(key, row) == old_entry:
+            item = self.slots.get(key)
+            if item is not None:
+                self.tree.item(item, values=list(row))
+        elif old_position is None:
+            self._changed(new_position, 1)
+        elif new_position is None:
+            self._changed(old_position, -1)
+        elif min(old_position, new_position) < self.offset + len(self.items) and max(old_position, new_position) >= self.offset:
+            self._fill(self.offset)
+
+    def on_delete(self, key, row):
+        position = self._position_of(key, row)
+        self.orders.on_delete(key, row)
+        if position is not None:
+            self._changed(position, -1)
+
+    def on_batch_end(self):
+        if self.stale:
+            self.stale = False
+            self._fill(self.offset)
+
+    # A row was added or removed at display position; keep the rows on
+    # screen steady and refill the pool only if the change falls inside it
+    # (once per batch when the store is applying one)
+    def _changed(self, position, delta):
+        count = len(self.items)
+        if position < self.offset:
+            self.offset += delta
+            self._update_scrollbar()
+        elif position < self.offset + count or count < min(len(self), self.pool_size):
+            if self.store.batching:
+                self.stale = True
+            else:
+                self._fill(self.offset)
+        else:
+            self._update_scrollbar()
+
+    def _lists(self):
+        return self.orders.lists(self.sort_column, self.statuses)
+
+    def _shown(self, row):
+        return self.statuses is None or row[2] in self.statuses
+
+    def _entry(self, key, row):
+        return self.orders.entry(self.sort_column, key, row)
+
+    # Display position of the record key holding row, as the orders stand now
+    def _position_of(self, key, row):
+        if not self._shown(row):
+            return None
+        return self._display_position(merged_rank(self._lists(), self._entry(key, row)))
+
+    def _display_position(self, index):
+        return len(self) - 1 - index if self.sort_reverse else index
+
+    def _entry_at(self, position):
+        return merged_nth(self._lists(), self._display_position(position))
+
+    # Keys of count rows from display position offset down
+    def _window(self, offset, count):
+        if self.sort_reverse:
+            entries = merged_slice(self._lists(), len(self) - offset - count, count)
+            entries.reverse()
+        else:
+            entries = merged_slice(self._lists(), offset, count)
+        return [key for _, key in entries]
+
+    # The first shown key of matches after the record after in display order,
+    # or the first one if none is after it, by comparing sort entries
+    def _next_by_entry(self, matches, after):
+        records = self.store.records
+        seq = self.orders.seq
+        column = self.sort_column
+        reverse = self.sort_reverse
+        after_row = records.get(after) if after is not None else None
+        after_entry = self._entry(after, after_row) if after_row is not None and self._shown(after_row) else None
+        first = following = None
+        for key in matches:
+            row = records[key]
+            if not self._shown(row):
+                continue
+            entry = order_entry(seq, column, key, row)
+            if first is None or (entry > first if reverse else entry < first):
+                first = entry
+            if after_entry is not None and (entry < after_entry if reverse else entry > after_entry):
+                if following is None or (entry > following if reverse else entry < following):
+                    following = entry
+        return (following or first)[1]
+
+    # After the order changes, keep the selected row on screen if it is still
+    # shown, else go back to the top
+    def _show_selected_or_top(self):
+        selected_key = self.selected()
+        self._fill(0)
+        self.tree.yview_moveto(0)
+        if selected_key is not None and not self.see(selected_key):
+            self.selected_key = None
+
+    def _pool_size(self, visible):
+        return max(self.pool_size, visible + 2 * self.margin + 2)
+
+    # Absolute display positions [first, last) currently on screen
+    def _visible_range(self):
+        count = len(self.items)
+        first, last = (float(value) for value in self.tree.yview())
+        return self.offset + round(first * count), self.offset + round(last * count)
+
+    def _update_scrollbar(self):
+        total = len(self)
+        if total == 0:
+            self.scrollbar.set(0, 1)
+            return
+        first, last = self._visible_range()
+        self.scrollbar.set(first / total, last / total)
+
+    # Point the pooled items at the rows starting at display position offset,
+    # growing or shrinking the pool to fit, and carry the selection across
+    def _fill(self, offset, visible=0):
+        selected_key = self.selected()
+        total = len(self)
+        count = min(total, self._pool_size(visible))
+        offset = max(0, min(offset, total - count))
+        while len(self.items) < count:
+            self.items.append(self.tree.insert('', 'end'))
+        if len(self.items) > count:
+            self.tree.delete(*self.items[count:])
+            del self.items[count:]
+        self.keys = {}
+        self.slots = {}
+        for item, key in zip(self.items, self._window(offset, count)):
+            self.tree.item(item, values=list(self.store.records[key]))
+            self.keys[item] = key
+            self.slots[key] = item
+        self.offset = offset
+        item = self.slots.get(selected_key)
+        if item is not None:
+            self.tree.selection_set(item)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        self.selected_key = selected_key if selected_key in self.store else None
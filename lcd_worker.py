@@ -0,0 +1,101 @@
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from lcd_trace import span
+
+
+# Runs storage work off the Tk main thread on a small thread pool. Jobs that
+# name the same key run one after another in the order they were submitted;
+# anything else may run in parallel, except a barrier job, which runs alone:
+# after every job submitted before it and before any submitted after it.
+# Results come back through a queue that the main thread drains with
+# root.after, so on_done/on_error callbacks and anything passed to post()
+# always run on the Tk thread, and a job's results are queued before any job
+# waiting for it can start.
+class IOExecutor:
+    def __init__(self, root, on_error, on_busy_change=None, workers=4, poll_ms=50):
+        self.root = root
+        self.on_error = on_error
+        self.on_busy_change = on_busy_change
+        self.poll_ms = poll_ms
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lcd-io')
+        self.results = queue.Queue()
+        self.tails = {}  # key -> future of the last job submitted for it
+        self.outstanding = set()  # futures of jobs whose results have not been handled yet
+        self.barrier = None  # future of the last barrier job
+        self.pending = 0
+        self.root.after(poll_ms, self._poll)
+
+    # Run fn(*args) on the pool, then on_done(result) on the Tk thread.
+    # keys lists the records the job writes; it starts only after earlier
+    # jobs on any of those keys have finished. A barrier job (one that reads
+    # the whole log, say) starts only after every earlier job has finished,
+    # and holds back every later one. name labels the job's timing span
+    # (default: the function's name).
+    def submit(self, fn, *args, on_done=None, on_error=None, keys=(), barrier=False, name=None):
+        if barrier:
+            previous = list(self.outstanding)
+        else:
+            previous = [self.tails[key] for key in keys if key in self.tails]
+            if self.barrier is not None:
+                previous.append(self.barrier)
+        name = 'io.' + (name or getattr(fn, '__name__', 'job'))
+        future = Future()
+        self.pool.submit(self._run, future, previous, fn, args, name, time.perf_counter(),
+                         on_done, on_error or self.on_error, keys)
+        for key in keys:
+            self.tails[key] = future
+        if barrier:
+            self.barrier = future
+        self.outstanding.add(future)
+        self.pending += 1
+        if self.on_busy_change:
+            self.on_busy_change(self.pending)
+        return future
+
+    # Called from a job to run fn(*args) on the Tk thread, e.g. for progress
+    def post(self, fn, *args):
+        self.results.put((None, fn, args, None))
+
+    # Wait for queued writes to reach storage before the program exits
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    # Queue the result, then complete the future, so anything that waits for
+    # this job has its results queued after this one's
+    def _run(self, future, previous, fn, args, name, submitted, on_done, on_error, keys):
+        # Earlier jobs were queued ahead of this one, so they are already
+        # running or done and waiting here cannot deadlock the pool
+        wait(previous)
+        try:
+            with span(name, queued_ms=round((time.perf_counter() - submitted) * 1000, 2)):
+                result = fn(*args)
+        except BaseException as error:
+            self.results.put((future, on_error, error, keys))
+            future.set_exception(error)
+        else:
+            self.results.put((future, on_done, result, keys))
+            future.set_result(result)
+
+    def _poll(self):
+        while True:
+            try:
+                future, callback, value, keys = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if future is None:
+                callback(*value)
+                continue
+            for key in keys:
+                if self.tails.get(key) is future:
+                    del self.tails[key]
+            if self.barrier is future:
+                self.barrier = None
+            self.outstanding.discard(future)
+            self.pending -= 1
+            if self.on_busy_change:
+                self.on_busy_change(self.pending)
+            if callback is not None:
+                callback(value)
+        self.root.after(self.poll_ms, self._poll)